@@ -0,0 +1,335 @@
+
+"""
+Local stand-in for the Tanhkapay punch upload endpoint.
+
+Implements the contract send_punch_data() depends on: Basic auth, a JSON body of
+{"punchingDetails": [...]} (optionally gzip/deflate/zstd encoded) and a reply of
+{"message": "Data Saved Successfully. ...", "commonData": "<JSON string>"} whose
+successfullySavedTransactionIds lists the saved transaction ids.
+
+By default every request succeeds immediately. A StandinBehavior adds the production
+failure modes: latency distributions, 5xx errors, 429 with Retry-After, rejected batches,
+partial success, body-size limits and slow request reads. Run it on its own with
+
+    python bench/api_standin.py --port 8085 --latency lognormal:-2.5,0.6 --error-rate 0.05 --rate-limit-rate 0.02
+
+and point TP_API_URL at the printed URL.
+"""
+
+import gzip
+import zlib
+import json
+import time
+import base64
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+SUCCESS_MESSAGE = "Data Saved Successfully."
+
+# Request bodies are read in pieces of this size when throttling slow reads
+_READ_PIECE = 16 * 1024
+
+
+def decode_body(body, encoding):
+    encoding = (encoding or '').strip().lower()
+    if encoding in ('', 'identity'):
+        return body
+    if encoding == 'gzip':
+        return gzip.decompress(body)
+    if encoding == 'deflate':
+        return zlib.decompress(body)
+    if encoding == 'zstd':
+        import zstandard
+        return zstandard.ZstdDecompressor().decompressobj().decompress(body)
+    raise ValueError(f"Unsupported Content-Encoding: {encoding}")
+
+
+def parse_latency(spec):
+    """
+    Parses a latency distribution into a function rng -> seconds. Specs (all in seconds):
+    `fixed:0.05`, `uniform:0.01,0.2`, `normal:mean,stddev`, `lognormal:mu,sigma`
+    (of the underlying normal, so the median is e**mu) and `exponential:mean`.
+    """
+    if not spec:
+        return lambda rng: 0.0
+    kind, _, params = spec.partition(':')
+    try:
+        values = [float(v) for v in params.split(',')] if params else []
+    except ValueError:
+        raise ValueError(f"Invalid latency spec: {spec}")
+    kind = kind.strip().lower()
+    shapes = {
+        'fixed': (1, lambda rng, v: v[0]),
+        'uniform': (2, lambda rng, v: rng.uniform(v[0], v[1])),
+        'normal': (2, lambda rng, v: rng.gauss(v[0], v[1])),
+        'lognormal': (2, lambda rng, v: rng.lognormvariate(v[0], v[1])),
+        'exponential': (1, lambda rng, v: rng.expovariate(1.0 / v[0]) if v[0] > 0 else 0.0),
+    }
+    if kind not in shapes or len(values) != shapes[kind][0]:
+        raise ValueError(f"Invalid latency spec: {spec}")
+    sample = shapes[kind][1]
+    return lambda rng: max(0.0, sample(rng, values))
+
+
+class StandinBehavior:
+    """
+    Failure injection knobs. Rates are probabilities per request, checked in the order
+    rate limit, error, reject, partial; the latency is added to every reply.
+    """
+
+    def __init__(self, latency=None, error_rate=0.0, error_statuses=(500, 502, 503),
+                 rate_limit_rate=0.0, retry_after=1, reject_rate=0.0,
+                 partial_rate=0.0, partial_fraction=0.5, max_body_bytes=0,
+                 slow_read_bps=0, seed=None):
+        self.latency = latency
+        self._sample_latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses) or (500,)
+        self.rate_limit_rate = rate_limit_rate
+        # Seconds sent in the Retry-After header of 429 replies; None leaves the header out
+        self.retry_after = retry_after
+        self.reject_rate = reject_rate
+        self.partial_rate = partial_rate
+        # Share of the batch reported as saved in a partial success
+        self.partial_fraction = partial_fraction
+        # 413 for bodies larger than this (compressed size, as sent); 0 for no limit
+        self.max_body_bytes = max_body_bytes
+        # Throttle reading the request body to this many bytes/second; 0 for full speed
+        self.slow_read_bps = slow_read_bps
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+
+    def roll(self, rate):
+        if rate <= 0:
+            return False
+        with self._rng_lock:
+            return self._rng.random() < rate
+
+    def delay(self):
+        with self._rng_lock:
+            return self._sample_latency(self._rng)
+
+    def error_status(self):
+        with self._rng_lock:
+            return self._rng.choice(self.error_statuses)
+
+    def saved_subset(self, txn_ids):
+        """Random subset of the batch, in the original order, for a partial success."""
+        keep = int(len(txn_ids) * self.partial_fraction)
+        with self._rng_lock:
+            chosen = set(self._rng.sample(range(len(txn_ids)), keep))
+        return [txn_id for i, txn_id in enumerate(txn_ids) if i in chosen]
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    # Keep-alive, like the real endpoint behind its load balancer
+    protocol_version = 'HTTP/1.1'
+    # Small replies would otherwise wait on delayed ACKs and skew latency
+    disable_nagle_algorithm = True
+    server_version = 'TanhkapayStandin/1.0'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_POST(self):
+        server = self.server
+        behavior = server.behavior
+        started = time.monotonic()
+        delay = behavior.delay()
+
+        if not self._authorized():
+            self._reply(401, {'message': 'Unauthorized'}, started, delay)
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        if behavior.max_body_bytes and length > behavior.max_body_bytes:
+            # Refuse without reading the body, then drop the connection as servers do
+            self.close_connection = True
+            server.record_request(0, 0, 413)
+            self._reply(413, {'message': f"Request body too large ({length} > {behavior.max_body_bytes} bytes)"},
+                        started, delay, {'Connection': 'close'})
+            return
+
+        body = self._read_body(length, behavior.slow_read_bps)
+
+        if behavior.roll(behavior.rate_limit_rate):
+            headers = {}
+            if behavior.retry_after is not None:
+                headers['Retry-After'] = str(behavior.retry_after)
+            server.record_request(len(body), 0, 429)
+            self._reply(429, {'message': 'Too Many Requests'}, started, delay, headers)
+            return
+
+        if behavior.roll(behavior.error_rate):
+            status = behavior.error_status()
+            server.record_request(len(body), 0, status)
+            self._reply(status, {'message': 'Internal Server Error'}, started, delay)
+            return
+
+        try:
+            payload = json.loads(decode_body(body, self.headers.get('Content-Encoding')))
+            details = payload['punchingDetails']
+            txn_ids = [str(record[server.id_field]) for record in details]
+        except Exception as e:
+            server.record_request(len(body), 0, 400)
+            self._reply(400, {'message': f"Invalid payload: {e}"}, started, delay)
+            return
+
+        if behavior.roll(behavior.reject_rate):
+            # 200 without the success message: the client must not acknowledge anything
+            server.record_request(len(body), 0, 200, rejected=True)
+            self._reply(200, {'message': "Validation failed. No records saved.", 'commonData': ""}, started, delay)
+            return
+
+        partial = behavior.roll(behavior.partial_rate)
+        saved = behavior.saved_subset(txn_ids) if partial else txn_ids
+        server.record_request(len(body), len(saved), 200, partial=partial)
+        self._reply(200, {
+            'message': f"{SUCCESS_MESSAGE} {len(saved)} of {len(txn_ids)} records saved.",
+            # commonData is itself a JSON document encoded as a string
+            'commonData': json.dumps({'successfullySavedTransactionIds': ",".join(saved)}),
+        }, started, delay)
+
+    def _authorized(self):
+        server = self.server
+        if server.username is None:
+            return True
+        expected = base64.b64encode(f"{server.username}:{server.password}".encode('utf-8')).decode('ascii')
+        return self.headers.get('Authorization') == f"Basic {expected}"
+
+    def _read_body(self, length, bytes_per_second):
+        if not bytes_per_second:
+            return self.rfile.read(length)
+        pieces = []
+        remaining = length
+        while remaining > 0:
+            piece = self.rfile.read(min(_READ_PIECE, remaining, max(1, bytes_per_second)))
+            if not piece:
+                break
+            pieces.append(piece)
+            remaining -= len(piece)
+            time.sleep(len(piece) / bytes_per_second)
+        return b''.join(pieces)
+
+    def _reply(self, status, body, started=None, delay=0.0, headers=None):
+        if delay and started is not None:
+            # Latency counts from the start of the request, so slow reads are not double counted
+            remaining = delay - (time.monotonic() - started)
+            if remaining > 0:
+                time.sleep(remaining)
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), username=None, password=None,
+                 id_field='transactionId', behavior=None, verbose=False, handler_class=StandinHandler):
+        super().__init__(address, handler_class)
+        self.username = username
+        self.password = password
+        self.id_field = id_field
+        self.behavior = behavior or StandinBehavior()
+        self.verbose = verbose
+        self._stats_lock = threading.Lock()
+        self._thread = None
+        self.reset_stats()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/api/punches"
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self.stats = {'requests': 0, 'records': 0, 'bytes_received': 0,
+                          'partial': 0, 'rejected': 0, 'statuses': {}}
+
+    def record_request(self, body_bytes, records, status=200, partial=False, rejected=False):
+        with self._stats_lock:
+            self.stats['requests'] += 1
+            self.stats['records'] += records
+            self.stats['bytes_received'] += body_bytes
+            self.stats['partial'] += int(partial)
+            self.stats['rejected'] += int(rejected)
+            self.stats['statuses'][status] = self.stats['statuses'].get(status, 0) + 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="api-standin", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def start_standin(**kwargs):
+    """Starts a StandinServer on a background thread (a free port by default) and returns it."""
+    return StandinServer(**kwargs).start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Tanhkapay punch upload API with failure injection")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8085)
+    parser.add_argument('--username', help="required Basic auth user (default: accept any request)")
+    parser.add_argument('--password', default='')
+    parser.add_argument('--id-field', default='transactionId', help="punch field holding the transaction id")
+    parser.add_argument('--latency', metavar='SPEC',
+                        help="reply latency in seconds: fixed:S, uniform:MIN,MAX, normal:MEAN,SD, "
+                             "lognormal:MU,SIGMA or exponential:MEAN")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of requests failing with a 5xx")
+    parser.add_argument('--error-statuses', default='500,502,503', help="statuses used for errors")
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="share of requests answered 429")
+    parser.add_argument('--retry-after', type=int, default=1,
+                        help="Retry-After seconds on 429 replies (negative: omit the header)")
+    parser.add_argument('--reject-rate', type=float, default=0.0,
+                        help="share of requests answered 200 without the success message")
+    parser.add_argument('--partial-rate', type=float, default=0.0,
+                        help="share of requests where only part of the batch is saved")
+    parser.add_argument('--partial-fraction', type=float, default=0.5,
+                        help="share of the batch saved in a partial success")
+    parser.add_argument('--max-body-bytes', type=int, default=0, help="413 above this request size")
+    parser.add_argument('--slow-read-bps', type=int, default=0, help="read request bodies at this many bytes/s")
+    parser.add_argument('--seed', type=int, help="random seed, for reproducible failure sequences")
+    parser.add_argument('--verbose', action='store_true', help="log every request")
+    args = parser.parse_args()
+
+    behavior = StandinBehavior(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        error_statuses=[int(s) for s in args.error_statuses.split(',') if s.strip()],
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after if args.retry_after >= 0 else None,
+        reject_rate=args.reject_rate,
+        partial_rate=args.partial_rate,
+        partial_fraction=args.partial_fraction,
+        max_body_bytes=args.max_body_bytes,
+        slow_read_bps=args.slow_read_bps,
+        seed=args.seed,
+    )
+    server = StandinServer((args.host, args.port), args.username, args.password,
+                           id_field=args.id_field, behavior=behavior, verbose=args.verbose)
+    print(f"Mock Tanhkapay API listening on {server.url} (Ctrl+C to stop)", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Stats: {json.dumps(server.stats)}")
+
+
+if __name__ == '__main__':
+    main()
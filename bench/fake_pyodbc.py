@@ -0,0 +1,207 @@
+
+"""
+In-memory stand-in for the pyodbc module, used by the benchmarks.
+
+install() registers this module as `pyodbc` in sys.modules, so src/database.py talks to a
+FakeDatabase instead of SQL Server. The fake serves uspManageBioPunchesData the way SQL
+Server's `FOR JSON` does: one JSON array split across many single-column rows of
+`chunk_chars` characters, generated lazily so a million punches never sit in memory at once.
+"""
+
+import sys
+import json
+import time
+import threading
+from datetime import datetime, timedelta
+from itertools import islice
+
+from src.txn_ranges import decode_ranges
+
+# pyodbc module attributes the application may look at
+version = '5.0.1-fake'
+apilevel = '2.0'
+threadsafety = 1
+paramstyle = 'qmark'
+
+_database = None
+
+
+class Error(Exception):
+    pass
+
+
+class DatabaseError(Error):
+    pass
+
+
+class OperationalError(DatabaseError):
+    pass
+
+
+class FakeDatabase:
+    """
+    Synthetic punch table. Ids 1..record_count are pending until acknowledged through
+    UpdateBioSyncData, the TVP procedure or the #BioSyncAck staging table.
+    """
+
+    def __init__(self, record_count=1000, chunk_chars=2033, record_padding=0, query_delay=0.0):
+        self.chunk_chars = chunk_chars
+        self.record_padding = record_padding
+        # Simulated server-side time before the procedure's first row is available
+        self.query_delay = query_delay
+        self._lock = threading.Lock()
+        self.reset(record_count)
+
+    def reset(self, record_count=None):
+        with self._lock:
+            if record_count is not None:
+                self.record_count = record_count
+            self._acked = set()
+            self.connects = 0
+            self.ack_calls = 0
+
+    @property
+    def acked_count(self):
+        with self._lock:
+            return len(self._acked)
+
+    def acknowledge(self, txn_ids):
+        with self._lock:
+            self.ack_calls += 1
+            for txn_id in txn_ids:
+                txn_id = int(txn_id)
+                if 1 <= txn_id <= self.record_count:
+                    self._acked.add(txn_id)
+
+    def make_record(self, txn_id):
+        punch_time = datetime(2024, 1, 1, 8, 0, 0) + timedelta(seconds=txn_id * 37)
+        record = {
+            'transactionId': txn_id,
+            'empCode': f"EMP{txn_id % 500:04d}",
+            'deviceId': f"DEV{txn_id % 8:02d}",
+            'punchTime': punch_time.isoformat(),
+            'punchDirection': 'IN' if txn_id % 2 else 'OUT',
+        }
+        if self.record_padding:
+            record['remarks'] = 'x' * self.record_padding
+        return record
+
+    def iter_json_rows(self, after=None):
+        """Yields 1-tuples holding consecutive slices of the pending punches' JSON array."""
+        start = 1 if after is None else int(after) + 1
+        with self._lock:
+            acked = set(self._acked)
+            end = self.record_count
+        pending = (i for i in range(start, end + 1) if i not in acked)
+
+        first = next(pending, None)
+        if first is None:
+            # FOR JSON returns no rows at all for an empty result
+            return
+        buffer = '[' + json.dumps(self.make_record(first), separators=(',', ':'))
+        for txn_id in pending:
+            buffer += ',' + json.dumps(self.make_record(txn_id), separators=(',', ':'))
+            while len(buffer) >= self.chunk_chars:
+                yield (buffer[:self.chunk_chars],)
+                buffer = buffer[self.chunk_chars:]
+        buffer += ']'
+        for pos in range(0, len(buffer), self.chunk_chars):
+            yield (buffer[pos:pos + self.chunk_chars],)
+
+
+class Cursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.arraysize = 1
+        self.fast_executemany = False
+        self._rows = iter(())
+
+    @property
+    def _db(self):
+        return self.connection.database
+
+    def execute(self, sql, params=()):
+        if self.connection.closed:
+            raise OperationalError("Connection is closed")
+        params = tuple(params or ())
+        self._rows = iter(())
+
+        if 'uspManageBioPunchesData' in sql:
+            action = params[0] if params else None
+            if action == 'getBioPunchesData':
+                self._start_query(self._db.iter_json_rows())
+            elif isinstance(action, str) and action.startswith('getBioPunchesData'):
+                # INCREMENTAL_FETCH_ACTION: the watermark travels in the second parameter
+                self._start_query(self._db.iter_json_rows(after=params[1]))
+            elif action == 'UpdateBioSyncData':
+                self._db.acknowledge(decode_ranges(params[1] or ''))
+            elif len(params) > 1 and params[1] is None:
+                # ACK_STAGING_ACTION: acknowledge whatever was bulk inserted into #BioSyncAck
+                self._db.acknowledge(self.connection.staging)
+        elif '#BioSyncAck' in sql:
+            if sql.lstrip().upper().startswith('TRUNCATE'):
+                self.connection.staging = []
+        elif sql.lstrip().startswith('{CALL') and params and isinstance(params[0], (list, tuple)):
+            # ACK_TVP_PROCEDURE: a single table-valued parameter of (txnId,) rows
+            self._db.acknowledge(row[0] for row in params[0])
+        else:
+            # Health checks (SELECT 1) and anything else
+            self._rows = iter([(1,)])
+        return self
+
+    def _start_query(self, rows):
+        if self._db.query_delay:
+            time.sleep(self._db.query_delay)
+        self._rows = rows
+
+    def executemany(self, sql, seq_of_params):
+        if '#BioSyncAck' in sql:
+            self.connection.staging.extend(row[0] for row in seq_of_params)
+
+    def fetchone(self):
+        return next(self._rows, None)
+
+    def fetchmany(self, size=None):
+        return list(islice(self._rows, size or self.arraysize))
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def close(self):
+        self._rows = iter(())
+
+
+class Connection:
+    def __init__(self, database):
+        self.database = database
+        self.closed = False
+        # Session temp table #BioSyncAck
+        self.staging = []
+
+    def cursor(self):
+        return Cursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def connect(connection_string=None, **kwargs):
+    if _database is None:
+        raise OperationalError("fake_pyodbc.install() has not been called")
+    with _database._lock:
+        _database.connects += 1
+    return Connection(_database)
+
+
+def install(database):
+    """Makes `import pyodbc` resolve to this module, backed by `database`."""
+    global _database
+    _database = database
+    sys.modules['pyodbc'] = sys.modules[__name__]
+    return database
@@ -0,0 +1,305 @@
+
+"""
+Offline sync throughput benchmark.
+
+Runs complete sync cycles against a fake pyodbc (bench/fake_pyodbc.py) and a local API
+stand-in (bench/api_standin.py), so no SQL Server or Tanhkapay endpoint is needed.
+Each punch count runs in its own subprocess so peak RSS is measured per size.
+
+    python bench/run_bench.py --sizes 1000 10000 100000 --repeat 5
+    python bench/run_bench.py --sizes 1000000 --repeat 1 --set UPLOAD_WORKERS=4
+    python bench/run_bench.py --sizes 1000000 --repeat 3 --backend sqlite
+    python bench/run_bench.py --sizes 10000 --api latency=lognormal:-3,0.5 --api rate_limit_rate=0.05
+
+Results (records/sec, p50/p95 cycle latency, peak RSS, median stage timings) are written
+as JSON to bench/results/ for comparison across versions.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from datetime import datetime
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.insert(0, project_root)
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+RESULTS_DIR = os.path.join(current_dir, 'results')
+
+
+def percentile(values, pct):
+    """Linear-interpolated percentile of a non-empty list."""
+    ordered = sorted(values)
+    if len(ordered) == 1:
+        return ordered[0]
+    rank = (len(ordered) - 1) * pct / 100.0
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process, or None where it cannot be read."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss)
+    except ImportError:
+        return None
+
+
+def git_revision():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=project_root,
+                             capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def parse_overrides(pairs):
+    overrides = {}
+    for pair in pairs or ():
+        name, sep, value = pair.partition('=')
+        if not sep:
+            raise SystemExit(f"--set expects KEY=VALUE, got {pair!r}")
+        overrides[name.strip()] = value
+    return overrides
+
+
+def parse_api_behavior(pairs):
+    """--api NAME=VALUE pairs as StandinBehavior keyword arguments (values are JSON, except latency)."""
+    behavior = {}
+    for name, value in parse_overrides(pairs).items():
+        behavior[name] = value if name == 'latency' else json.loads(value)
+    return behavior
+
+
+# --- Worker (one punch count, in a fresh process) ---
+
+class SqliteDatabase:
+    """Benchmark handle on a populated SQLite stand-in database (DB_BACKEND=sqlite)."""
+
+    def __init__(self, path, record_count):
+        from src import sqlite_backend
+        self._backend = sqlite_backend
+        self.path = path
+        sqlite_backend.populate(path, record_count, seed=1)
+
+    def reset(self):
+        self._backend.reset_sync_state(self.path)
+
+    @property
+    def acked_count(self):
+        return self._backend.punch_counts(self.path)['synced']
+
+
+def reset_local_state(outbox, watermark):
+    with outbox._outbox_lock:
+        if outbox._outbox is not None:
+            outbox._outbox.close()
+            outbox._outbox = None
+    watermark._watermark = None
+    path = os.environ['OUTBOX_PATH']
+    for name in (path, path + '-wal', path + '-shm', os.environ['WATERMARK_PATH']):
+        if os.path.exists(name):
+            os.remove(name)
+
+
+def run_worker(args):
+    from bench import fake_pyodbc
+    from bench.api_standin import start_standin, StandinBehavior
+
+    state_dir = tempfile.mkdtemp(prefix='paython-bench-')
+    if args.backend == 'sqlite':
+        # Populating is not part of the measurement
+        database = SqliteDatabase(os.path.join(state_dir, 'punches.db'), args.size)
+    else:
+        database = fake_pyodbc.install(fake_pyodbc.FakeDatabase(
+            record_count=args.size,
+            chunk_chars=args.chunk_chars,
+            record_padding=args.record_padding,
+        ))
+    server = start_standin(username='bench', password='bench',
+                           behavior=StandinBehavior(**parse_api_behavior(args.api)))
+
+    # Environment variables take precedence over config/.env
+    os.environ.update({
+        'DB_BACKEND': args.backend if args.backend == 'sqlite' else 'sqlserver',
+        'SQLITE_PATH': os.path.join(state_dir, 'punches.db'),
+        'DB_SERVER': 'bench', 'DB_NAME': 'bench', 'DB_USER': 'bench', 'DB_PASSWORD': 'bench',
+        'TP_API_URL': server.url, 'API_USERNAME': 'bench', 'API_PASSWORD': 'bench',
+        'LOG_TO_FILE': 'False', 'LOG_LEVEL': args.log_level,
+        'OUTBOX_PATH': os.path.join(state_dir, 'outbox.db'),
+        'WATERMARK_PATH': os.path.join(state_dir, 'watermark.json'),
+    })
+    os.environ.update(parse_overrides(args.set))
+
+    if args.engine == 'async':
+        import asyncio
+        from src.async_sync import run_sync_async
+        run_cycle = lambda: asyncio.run(run_sync_async())
+    else:
+        from src.main import run_sync
+        run_cycle = run_sync
+
+    from src import outbox, watermark
+
+    cycles = []
+    for _ in range(args.repeat):
+        database.reset()
+        # Every cycle starts from a full backlog, so forget the previous cycle's watermark
+        # and outbox too; otherwise later cycles only drain what an earlier one left behind
+        reset_local_state(outbox, watermark)
+        server.reset_stats()
+        started = time.perf_counter()
+        result = run_cycle()
+        elapsed = time.perf_counter() - started
+        cycles.append({
+            'seconds': elapsed,
+            'success': bool(result.get('success')),
+            'acknowledged': database.acked_count,
+            'requests': server.stats['requests'],
+            'bytes_received': server.stats['bytes_received'],
+            'stages_ms': result.get('timings', {}).get('stages_ms', {}),
+            'message': result.get('message'),
+        })
+
+    server.stop()
+    with open(args.worker_output, 'w') as f:
+        json.dump({'cycles': cycles, 'peak_rss_bytes': peak_rss_bytes()}, f)
+
+
+# --- Runner ---
+
+def summarize(size, worker_result):
+    cycles = worker_result['cycles']
+    seconds = [c['seconds'] for c in cycles]
+    stage_names = sorted({stage for c in cycles for stage in c['stages_ms']})
+    return {
+        'records': size,
+        'cycles': len(cycles),
+        'all_synced': all(c['success'] and c['acknowledged'] == size for c in cycles),
+        'records_per_sec': round(sum(c['acknowledged'] for c in cycles) / sum(seconds), 1),
+        'cycle_p50_ms': round(percentile(seconds, 50) * 1000, 1),
+        'cycle_p95_ms': round(percentile(seconds, 95) * 1000, 1),
+        'peak_rss_mb': (round(worker_result['peak_rss_bytes'] / (1024 * 1024), 1)
+                        if worker_result['peak_rss_bytes'] else None),
+        'http_requests_per_cycle': statistics.median(c['requests'] for c in cycles),
+        'request_bytes_per_cycle': statistics.median(c['bytes_received'] for c in cycles),
+        'stages_ms_p50': {
+            stage: round(statistics.median(c['stages_ms'].get(stage, 0.0) for c in cycles), 1)
+            for stage in stage_names
+        },
+        'last_message': cycles[-1]['message'] if cycles else None,
+    }
+
+
+def run_size(size, args):
+    fd, output = tempfile.mkstemp(prefix='paython-bench-', suffix='.json')
+    os.close(fd)
+    command = [
+        sys.executable, os.path.abspath(__file__), '--worker',
+        '--size', str(size),
+        '--repeat', str(args.repeat),
+        '--engine', args.engine,
+        '--backend', args.backend,
+        '--chunk-chars', str(args.chunk_chars),
+        '--record-padding', str(args.record_padding),
+        '--log-level', args.log_level,
+        '--worker-output', output,
+    ]
+    for pair in args.set or ():
+        command += ['--set', pair]
+    for pair in args.api or ():
+        command += ['--api', pair]
+    try:
+        subprocess.run(command, cwd=project_root, check=True,
+                       stdout=None if args.verbose else subprocess.DEVNULL)
+        with open(output) as f:
+            return summarize(size, json.load(f))
+    finally:
+        os.remove(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the punch sync cycle")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                        help="punch counts to benchmark (default: 1000 10000 100000)")
+    parser.add_argument('--repeat', type=int, default=5, help="sync cycles per size (default: 5)")
+    parser.add_argument('--engine', choices=('threaded', 'async'), default='threaded')
+    parser.add_argument('--backend', choices=('fake', 'sqlite'), default='fake',
+                        help="fake: in-memory pyodbc stand-in; sqlite: real indexed SQLite table via "
+                             "DB_BACKEND=sqlite (--chunk-chars and --record-padding apply to fake only)")
+    parser.add_argument('--chunk-chars', type=int, default=2033,
+                        help="characters per FOR JSON row (SQL Server uses 2033)")
+    parser.add_argument('--record-padding', type=int, default=0,
+                        help="extra characters per punch record, to simulate wider rows")
+    parser.add_argument('--set', action='append', metavar='KEY=VALUE',
+                        help="setting override for the run, e.g. --set UPLOAD_WORKERS=4")
+    parser.add_argument('--api', action='append', metavar='NAME=VALUE',
+                        help="failure injection for the API stand-in (StandinBehavior arguments), "
+                             "e.g. --api error_rate=0.05 --api latency=uniform:0.01,0.1")
+    parser.add_argument('--log-level', default='WARNING')
+    parser.add_argument('--label', help="name for this run in the results (default: git revision)")
+    parser.add_argument('--output', help="results file (default: bench/results/bench-<timestamp>.json)")
+    parser.add_argument('--verbose', action='store_true', help="show the application's console log")
+    # Internal: run one size in this process
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--worker-output', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    revision = git_revision()
+    report = {
+        'label': args.label or revision,
+        'revision': revision,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'engine': args.engine,
+        'backend': args.backend,
+        'settings': parse_overrides(args.set),
+        'api_behavior': parse_api_behavior(args.api),
+        'chunk_chars': args.chunk_chars,
+        'record_padding': args.record_padding,
+        'results': [],
+    }
+
+    for size in args.sizes:
+        print(f"Benchmarking {size} punches x {args.repeat} cycles...", flush=True)
+        summary = run_size(size, args)
+        report['results'].append(summary)
+        print(f"  {summary['records_per_sec']} records/s, p50 {summary['cycle_p50_ms']} ms, "
+              f"p95 {summary['cycle_p95_ms']} ms, peak RSS {summary['peak_rss_mb']} MB"
+              + ("" if summary['all_synced'] else "  (NOT all records synced)"), flush=True)
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"bench-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
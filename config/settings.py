@@ -1,76 +1,551 @@
+import io
 import os
+import sys
+import hashlib
+import threading
+from dataclasses import dataclass
+
+_TRUE_VALUES = ('true', '1', 'yes')
+
+_snapshot = None
+_env_path = None
+_env_stat = None
+_env_digest = None
+# Variables whose current value came from the .env file rather than the process environment
+_env_file_keys = set()
+_lock = threading.RLock()
 
 def build_connection_string(server, database, username, password):
     if server and database and username and password:
         return f"Driver={{SQL Server}};Server={server};Database={database};UID={username};PWD={password};Timeout=45;"
     return None
 
+def _str(env, name, default=None):
+    return env.get(name, default)
+
+def _application_path():
+    # Same rule as main.get_application_path(): the executable's directory when frozen,
+    # otherwise the project root
+    if getattr(sys, 'frozen', False):
+        return os.path.dirname(sys.executable)
+    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def is_foreign_path(value):
+    """True for a Windows drive or UNC path (e.g. from a copied .env) on a non-Windows host."""
+    if os.name == 'nt':
+        return False
+    return (value[:1].isalpha() and value[1:3] in (':\\', ':/')) or value.startswith('\\\\')
+
+def _path(env, name, default):
+    """
+    A file or directory path; relative paths are resolved against the application directory,
+    not the CWD. Paths meant for another platform fall back to `default`.
+    """
+    value = env.get(name, default)
+    if is_foreign_path(value):
+        value = default
+    if os.path.isabs(value):
+        return value
+    return os.path.normpath(os.path.join(_application_path(), value))
+
+def _bool(env, name, default):
+    return env.get(name, default).lower() in _TRUE_VALUES
+
+def _int(env, name, default):
+    try:
+        return int(env.get(name, str(default)))
+    except ValueError:
+        return default
+
+def _float(env, name, default):
+    try:
+        return float(env.get(name, str(default)))
+    except ValueError:
+        return default
+
+def _choice(env, name, default, choices):
+    val = env.get(name, default).strip().lower()
+    return val if val in choices else default
+
+def _status_set(env, name, default):
+    statuses = set()
+    for part in env.get(name, default).split(','):
+        part = part.strip()
+        if part.isdigit():
+            statuses.add(int(part))
+    return frozenset(statuses)
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    Immutable snapshot of the configuration, parsed once from the environment.
+    Obtain it with get_settings(); it is rebuilt by load()/refresh()/reload().
+    """
+    db_server: str = None
+    db_name: str = None
+    db_user: str = None
+    db_password: str = None
+    db_connection_string_override: str = None
+    # 'sqlserver' (pyodbc) or 'sqlite', a local stand-in for uspManageBioPunchesData
+    db_backend: str = 'sqlserver'
+    sqlite_path: str = './Data/punches.db'
+    tp_api_url: str = None
+    api_username: str = None
+    api_password: str = None
+    log_path: str = './Logs/'
+    log_level: str = 'INFO'
+    log_to_file: bool = True
+    # Records buffered between the logging threads and the writer thread
+    log_queue_size: int = 10000
+    # A log file is rolled over at midnight or when it reaches this size (0 = no size cap)
+    log_max_bytes: int = 10 * 1024 * 1024
+    # Rotated logs older than this are deleted (0 = keep)
+    log_retention_days: int = 30
+    # Upper bound for all log files together (0 = unbounded)
+    log_max_total_mb: int = 500
+    # gzip rotated log files
+    log_compress: bool = True
+    start_minimized: bool = False
+    minimize_to_tray: bool = True
+    sync_interval: int = 60
+    scheduler_auto_start: bool = False
+    app_password: str = None
+    is_logged_in: bool = False
+
+    db_pool_min_size: int = 1
+    db_pool_max_size: int = 4
+    # Seconds an unused connection may sit in the pool before it is closed
+    db_pool_idle_timeout: int = 600
+    # Seconds after which a connection is recycled regardless of use
+    db_pool_max_lifetime: int = 3600
+    db_pool_borrow_timeout: int = 60
+    # Rows pulled per fetchmany() round trip when streaming FOR JSON output
+    db_fetch_arraysize: int = 100
+    upload_batch_max_records: int = 1000
+    # Upper bound for the encoded JSON of one upload request
+    upload_batch_max_bytes: int = 2 * 1024 * 1024
+    # Batches buffered between the read, upload and acknowledge stages
+    pipeline_queue_size: int = 2
+    # Keep-alive connections held open to the API host
+    http_pool_size: int = 4
+    http_connect_timeout: int = 15
+    http_read_timeout: int = 300
+    # none, gzip, deflate or zstd (zstd needs the optional 'zstandard' package)
+    upload_compression: str = 'none'
+    # Bodies smaller than this are sent uncompressed
+    upload_compression_min_bytes: int = 4096
+    upload_compression_level: int = 6
+    # Number of batches uploaded to the API in parallel
+    upload_workers: int = 2
+    # 'batch' acknowledges each batch as it is saved; 'consolidated' makes a single
+    # update_sync_status call with every saved id once all uploads have finished
+    ack_mode: str = 'batch'
+    outbox_enabled: bool = True
+    outbox_path: str = './Data/outbox.db'
+    # Upload attempts the API answers without saving a record before it is parked; 0 never parks
+    outbox_max_attempts: int = 5
+    # Field of a punch record that matches the API's successfullySavedTransactionIds
+    punch_id_field: str = 'transactionId'
+    # Total attempts per upload, including the first one
+    http_max_attempts: int = 4
+    http_backoff_base: float = 1.0
+    http_backoff_max: float = 60.0
+    http_retry_statuses: frozenset = frozenset((429, 500, 502, 503, 504))
+    circuit_failure_threshold: int = 5
+    # Seconds an open circuit waits before letting a probe request through
+    circuit_reset_timeout: float = 60.0
+    # Fetch only punches beyond the stored watermark. Requires uspManageBioPunchesData
+    # to support incremental_fetch_action.
+    incremental_fetch: bool = False
+    incremental_fetch_action: str = 'getBioPunchesDataAfter'
+    watermark_path: str = './Data/watermark.json'
+    # How often an incremental sync falls back to a full scan to catch stragglers
+    full_sweep_interval_minutes: float = 1440
+    # Transaction ids acknowledged per UpdateBioSyncData call (one transaction each)
+    ack_chunk_size: int = 1000
+    # 'procedure' passes a comma separated list to UpdateBioSyncData, 'tvp' calls
+    # ack_tvp_procedure with a table-valued parameter, 'staging' bulk inserts into a
+    # temp table and calls ack_staging_action
+    ack_method: str = 'procedure'
+    ack_tvp_procedure: str = 'uspUpdateBioSyncDataTvp'
+    ack_staging_action: str = 'UpdateBioSyncDataFromStaging'
+    # 'ranges' sends ids to UpdateBioSyncData as e.g. 1001-1500,1502 (the procedure must
+    # expand them); 'list' sends a plain comma separated list
+    ack_txn_encoding: str = 'list'
+    # Seconds a stopping daemon waits for the running cycle; keep below systemd's TimeoutStopSec
+    daemon_stop_timeout: float = 80.0
+    # Seconds a daemon sync cycle may run before the watchdog is no longer fed; 0 for
+    # twice the sync interval
+    daemon_cycle_timeout: float = 0.0
+    # Port for the daemon's Prometheus /metrics listener; 0 disables it
+    metrics_port: int = 0
+    metrics_host: str = '127.0.0.1'
+
+    @property
+    def db_connection_string(self):
+        # Prefer constructing from components
+        built_str = build_connection_string(self.db_server, self.db_name, self.db_user, self.db_password)
+        if built_str:
+            return built_str
+        return self.db_connection_string_override
+
+    @classmethod
+    def from_env(cls, env=None):
+        env = os.environ if env is None else env
+        return cls(
+            db_server=_str(env, 'DB_SERVER'),
+            db_name=_str(env, 'DB_NAME'),
+            db_user=_str(env, 'DB_USER'),
+            db_password=_str(env, 'DB_PASSWORD'),
+            db_connection_string_override=_str(env, 'DB_CONNECTION_STRING'),
+            db_backend=_choice(env, 'DB_BACKEND', 'sqlserver', ('sqlserver', 'sqlite')),
+            sqlite_path=_path(env, 'SQLITE_PATH', './Data/punches.db'),
+            tp_api_url=_str(env, 'TP_API_URL'),
+            api_username=_str(env, 'API_USERNAME'),
+            api_password=_str(env, 'API_PASSWORD'),
+            log_path=_path(env, 'LOG_PATH', './Logs/'),
+            log_level=_str(env, 'LOG_LEVEL', 'INFO'),
+            log_to_file=_bool(env, 'LOG_TO_FILE', 'True'),
+            log_queue_size=_int(env, 'LOG_QUEUE_SIZE', 10000),
+            log_max_bytes=_int(env, 'LOG_MAX_BYTES', 10 * 1024 * 1024),
+            log_retention_days=_int(env, 'LOG_RETENTION_DAYS', 30),
+            log_max_total_mb=_int(env, 'LOG_MAX_TOTAL_MB', 500),
+            log_compress=_bool(env, 'LOG_COMPRESS', 'True'),
+            start_minimized=_bool(env, 'START_MINIMIZED', 'False'),
+            minimize_to_tray=_bool(env, 'MINIMIZE_TO_TRAY', 'True'),
+            sync_interval=_int(env, 'SYNC_INTERVAL', 60),
+            scheduler_auto_start=_bool(env, 'SCHEDULER_AUTO_START', 'False'),
+            app_password=_str(env, 'APP_PASSWORD'),
+            is_logged_in=_bool(env, 'IS_LOGGED_IN', 'False'),
+            db_pool_min_size=_int(env, 'DB_POOL_MIN_SIZE', 1),
+            db_pool_max_size=_int(env, 'DB_POOL_MAX_SIZE', 4),
+            db_pool_idle_timeout=_int(env, 'DB_POOL_IDLE_TIMEOUT', 600),
+            db_pool_max_lifetime=_int(env, 'DB_POOL_MAX_LIFETIME', 3600),
+            db_pool_borrow_timeout=_int(env, 'DB_POOL_BORROW_TIMEOUT', 60),
+            db_fetch_arraysize=_int(env, 'DB_FETCH_ARRAYSIZE', 100),
+            upload_batch_max_records=_int(env, 'UPLOAD_BATCH_MAX_RECORDS', 1000),
+            upload_batch_max_bytes=_int(env, 'UPLOAD_BATCH_MAX_BYTES', 2 * 1024 * 1024),
+            pipeline_queue_size=_int(env, 'PIPELINE_QUEUE_SIZE', 2),
+            http_pool_size=_int(env, 'HTTP_POOL_SIZE', 4),
+            http_connect_timeout=_int(env, 'HTTP_CONNECT_TIMEOUT', 15),
+            http_read_timeout=_int(env, 'HTTP_READ_TIMEOUT', 300),
+            upload_compression=_str(env, 'UPLOAD_COMPRESSION', 'none'),
+            upload_compression_min_bytes=_int(env, 'UPLOAD_COMPRESSION_MIN_BYTES', 4096),
+            upload_compression_level=_int(env, 'UPLOAD_COMPRESSION_LEVEL', 6),
+            upload_workers=max(1, _int(env, 'UPLOAD_WORKERS', 2)),
+            ack_mode=_choice(env, 'ACK_MODE', 'batch', ('batch', 'consolidated')),
+            outbox_enabled=_bool(env, 'OUTBOX_ENABLED', 'True'),
+            outbox_path=_path(env, 'OUTBOX_PATH', './Data/outbox.db'),
+            outbox_max_attempts=max(0, _int(env, 'OUTBOX_MAX_ATTEMPTS', 5)),
+            punch_id_field=_str(env, 'PUNCH_ID_FIELD', 'transactionId'),
+            http_max_attempts=max(1, _int(env, 'HTTP_MAX_ATTEMPTS', 4)),
+            http_backoff_base=_float(env, 'HTTP_BACKOFF_BASE', 1.0),
+            http_backoff_max=_float(env, 'HTTP_BACKOFF_MAX', 60.0),
+            http_retry_statuses=_status_set(env, 'HTTP_RETRY_STATUSES', '429,500,502,503,504'),
+            circuit_failure_threshold=_int(env, 'CIRCUIT_FAILURE_THRESHOLD', 5),
+            circuit_reset_timeout=_float(env, 'CIRCUIT_RESET_TIMEOUT', 60.0),
+            incremental_fetch=_bool(env, 'INCREMENTAL_FETCH', 'False'),
+            incremental_fetch_action=_str(env, 'INCREMENTAL_FETCH_ACTION', 'getBioPunchesDataAfter'),
+            watermark_path=_path(env, 'WATERMARK_PATH', './Data/watermark.json'),
+            full_sweep_interval_minutes=_float(env, 'FULL_SWEEP_INTERVAL_MINUTES', 1440),
+            ack_chunk_size=max(1, _int(env, 'ACK_CHUNK_SIZE', 1000)),
+            ack_method=_choice(env, 'ACK_METHOD', 'procedure', ('procedure', 'tvp', 'staging')),
+            ack_tvp_procedure=_str(env, 'ACK_TVP_PROCEDURE', 'uspUpdateBioSyncDataTvp'),
+            ack_staging_action=_str(env, 'ACK_STAGING_ACTION', 'UpdateBioSyncDataFromStaging'),
+            ack_txn_encoding=_choice(env, 'ACK_TXN_ENCODING', 'list', ('list', 'ranges')),
+            daemon_stop_timeout=_float(env, 'DAEMON_STOP_TIMEOUT', 80.0),
+            daemon_cycle_timeout=max(0.0, _float(env, 'DAEMON_CYCLE_TIMEOUT', 0.0)),
+            metrics_port=max(0, _int(env, 'METRICS_PORT', 0)),
+            metrics_host=_str(env, 'METRICS_HOST', '127.0.0.1'),
+        )
+
+# --- Snapshot management ---
+
+def get_settings():
+    """
+    Returns the current Settings snapshot. Never touches the filesystem; the first call
+    builds it from os.environ.
+    """
+    global _snapshot
+    snapshot = _snapshot
+    if snapshot is None:
+        with _lock:
+            if _snapshot is None:
+                _snapshot = Settings.from_env()
+            snapshot = _snapshot
+    return snapshot
+
+def _load_env_file(env_path, override):
+    """
+    Applies the .env file to os.environ and rebuilds the snapshot. Without `override`,
+    variables set by the process environment (systemd Environment=, the benchmarks) are
+    left alone, while values that an earlier load took from the file are updated.
+    """
+    global _snapshot, _env_path, _env_stat, _env_digest
+    from dotenv import dotenv_values
+
+    try:
+        stat = os.stat(env_path)
+        with open(env_path, 'rb') as f:
+            content = f.read()
+    except OSError:
+        stat, content = None, b''
+
+    values = dotenv_values(stream=io.StringIO(content.decode('utf-8', errors='replace')))
+    for name, value in values.items():
+        if value is None:
+            continue
+        if override or name not in os.environ or name in _env_file_keys:
+            os.environ[name] = value
+            _env_file_keys.add(name)
+    _env_path = env_path
+    _env_stat = (stat.st_mtime_ns, stat.st_size) if stat else None
+    _env_digest = hashlib.sha256(content).hexdigest()
+    _snapshot = Settings.from_env()
+    return _snapshot
+
+def load(env_path):
+    """
+    Loads `env_path` the first time it is seen (existing environment variables win).
+    Later calls only stat the file and reload it if its mtime/size changed and its
+    content hash differs. Returns the current snapshot.
+    """
+    with _lock:
+        if _env_path != env_path:
+            return _load_env_file(env_path, override=False)
+        return refresh()
+
+def refresh():
+    """
+    Reloads the tracked .env file if it changed on disk. Returns the current snapshot.
+    The process environment still wins; only reload() lets the file override it.
+    """
+    global _env_stat
+    with _lock:
+        if _env_path is None:
+            return get_settings()
+        try:
+            stat = os.stat(_env_path)
+            current = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            current = None
+        if current == _env_stat:
+            return get_settings()
+
+        try:
+            with open(_env_path, 'rb') as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+        except OSError:
+            digest = None
+        if digest == _env_digest:
+            # Touched but unchanged
+            _env_stat = current
+            return get_settings()
+        return _load_env_file(_env_path, override=False)
+
+def reload(env_path=None, override=True):
+    """
+    Re-reads the .env file unconditionally, by default overriding the environment (e.g.
+    after the UI saved it). Without a tracked file, rebuilds the snapshot from os.environ.
+    """
+    global _snapshot
+    with _lock:
+        env_path = env_path or _env_path
+        if env_path is None:
+            _snapshot = Settings.from_env()
+            return _snapshot
+        return _load_env_file(env_path, override=override)
+
+# --- Accessors ---
+
 def get_db_connection_string():
-    # Prefer constructing from components
-    server = os.getenv('DB_SERVER')
-    database = os.getenv('DB_NAME')
-    username = os.getenv('DB_USER')
-    password = os.getenv('DB_PASSWORD')
-    
-    built_str = build_connection_string(server, database, username, password)
-    if built_str:
-        return built_str
-        
-    return os.getenv('DB_CONNECTION_STRING')
+    return get_settings().db_connection_string
 
 def get_db_server():
-    return os.getenv('DB_SERVER')
+    return get_settings().db_server
 
 def get_db_name():
-    return os.getenv('DB_NAME')
+    return get_settings().db_name
 
 def get_db_user():
-    return os.getenv('DB_USER')
+    return get_settings().db_user
 
 def get_db_password():
-    return os.getenv('DB_PASSWORD')
+    return get_settings().db_password
+
+def get_db_backend():
+    return get_settings().db_backend
+
+def get_sqlite_path():
+    return get_settings().sqlite_path
 
 def get_tp_api_url():
-    return os.getenv('TP_API_URL')
+    return get_settings().tp_api_url
 
 def get_api_username():
-    return os.getenv('API_USERNAME')
+    return get_settings().api_username
 
 def get_api_password():
-    return os.getenv('API_PASSWORD')
+    return get_settings().api_password
 
 def get_log_path():
-    return os.getenv('LOG_PATH', './Logs/')
+    return get_settings().log_path
 
 def get_log_level():
-    return os.getenv('LOG_LEVEL', 'INFO')
+    return get_settings().log_level
 
 def get_log_to_file():
-    val = os.getenv('LOG_TO_FILE', 'True')
-    return val.lower() in ('true', '1', 'yes')
+    return get_settings().log_to_file
+
+def get_log_queue_size():
+    return get_settings().log_queue_size
+
+def get_log_max_bytes():
+    return get_settings().log_max_bytes
+
+def get_log_retention_days():
+    return get_settings().log_retention_days
+
+def get_log_max_total_mb():
+    return get_settings().log_max_total_mb
+
+def get_log_compress():
+    return get_settings().log_compress
 
 def get_start_minimized():
-    val = os.getenv('START_MINIMIZED', 'False')
-    return val.lower() in ('true', '1', 'yes')
+    return get_settings().start_minimized
 
 def get_minimize_to_tray():
-    val = os.getenv('MINIMIZE_TO_TRAY', 'True')
-    return val.lower() in ('true', '1', 'yes')
+    return get_settings().minimize_to_tray
 
 def get_sync_interval():
-    val = os.getenv('SYNC_INTERVAL', '60')
-    try:
-        return int(val)
-    except ValueError:
-        return 60
+    return get_settings().sync_interval
 
 def get_scheduler_auto_start():
-    val = os.getenv('SCHEDULER_AUTO_START', 'False')
-    return val.lower() in ('true', '1', 'yes')
+    return get_settings().scheduler_auto_start
 
 def get_app_password():
-    return os.getenv('APP_PASSWORD')
+    return get_settings().app_password
 
 def get_is_logged_in():
-    val = os.getenv('IS_LOGGED_IN', 'False')
-    return val.lower() in ('true', '1', 'yes')
+    return get_settings().is_logged_in
+
+def get_db_pool_min_size():
+    return get_settings().db_pool_min_size
+
+def get_db_pool_max_size():
+    return get_settings().db_pool_max_size
+
+def get_db_pool_idle_timeout():
+    return get_settings().db_pool_idle_timeout
+
+def get_db_pool_max_lifetime():
+    return get_settings().db_pool_max_lifetime
+
+def get_db_pool_borrow_timeout():
+    return get_settings().db_pool_borrow_timeout
+
+def get_db_fetch_arraysize():
+    return get_settings().db_fetch_arraysize
+
+def get_upload_batch_max_records():
+    return get_settings().upload_batch_max_records
+
+def get_upload_batch_max_bytes():
+    return get_settings().upload_batch_max_bytes
+
+def get_pipeline_queue_size():
+    return get_settings().pipeline_queue_size
+
+def get_http_pool_size():
+    return get_settings().http_pool_size
+
+def get_http_connect_timeout():
+    return get_settings().http_connect_timeout
+
+def get_http_read_timeout():
+    return get_settings().http_read_timeout
+
+def get_upload_compression():
+    return get_settings().upload_compression
+
+def get_upload_compression_min_bytes():
+    return get_settings().upload_compression_min_bytes
+
+def get_upload_compression_level():
+    return get_settings().upload_compression_level
+
+def get_upload_workers():
+    return get_settings().upload_workers
+
+def get_ack_mode():
+    return get_settings().ack_mode
+
+def get_outbox_enabled():
+    return get_settings().outbox_enabled
+
+def get_outbox_path():
+    return get_settings().outbox_path
+
+def get_outbox_max_attempts():
+    return get_settings().outbox_max_attempts
+
+def get_punch_id_field():
+    return get_settings().punch_id_field
+
+def get_http_max_attempts():
+    return get_settings().http_max_attempts
+
+def get_http_backoff_base():
+    return get_settings().http_backoff_base
+
+def get_http_backoff_max():
+    return get_settings().http_backoff_max
+
+def get_http_retry_statuses():
+    return get_settings().http_retry_statuses
+
+def get_circuit_failure_threshold():
+    return get_settings().circuit_failure_threshold
+
+def get_circuit_reset_timeout():
+    return get_settings().circuit_reset_timeout
+
+def get_incremental_fetch():
+    return get_settings().incremental_fetch
+
+def get_incremental_fetch_action():
+    return get_settings().incremental_fetch_action
+
+def get_watermark_path():
+    return get_settings().watermark_path
+
+def get_full_sweep_interval_minutes():
+    return get_settings().full_sweep_interval_minutes
+
+def get_ack_chunk_size():
+    return get_settings().ack_chunk_size
+
+def get_ack_method():
+    return get_settings().ack_method
+
+def get_ack_tvp_procedure():
+    return get_settings().ack_tvp_procedure
+
+def get_ack_staging_action():
+    return get_settings().ack_staging_action
+
+def get_ack_txn_encoding():
+    return get_settings().ack_txn_encoding
+
+def get_daemon_stop_timeout():
+    return get_settings().daemon_stop_timeout
+
+def get_daemon_cycle_timeout():
+    return get_settings().daemon_cycle_timeout
+
+def get_metrics_port():
+    return get_settings().metrics_port
+
+def get_metrics_host():
+    return get_settings().metrics_host
@@ -1,90 +1,364 @@
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError, ConnectTimeoutError
 import json
 import os
 import logging
 import base64
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 from config import settings
 
+try:
+    from src.compression import maybe_compress
+    from src.resilience import RetryPolicy, CircuitBreaker, parse_retry_after
+    from src.txn_ranges import decode_ranges
+    from src.timings import measure
+    from src import metrics
+except ImportError:
+    # Fallback for frozen executable where src might be flattened
+    from compression import maybe_compress
+    from resilience import RetryPolicy, CircuitBreaker, parse_retry_after
+    from txn_ranges import decode_ranges
+    from timings import measure
+    import metrics
+
 logger = logging.getLogger("PaythonProgram")
 
-def send_punch_data(data):
-    api_url = settings.get_tp_api_url()
-    username = settings.get_api_username()
-    password = settings.get_api_password()
+_session = None
+_session_pool_size = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """
+    Returns the process-wide HTTP session.
+
+    The session keeps connections to the API alive between requests, so repeated syncs
+    and multi-batch uploads reuse the same TCP/TLS connection instead of paying the
+    DNS lookup and handshake each time. It is shared by every thread that calls
+    run_sync() (scheduler threads in all three UIs); the underlying urllib3 pool is
+    thread-safe and holds up to HTTP_POOL_SIZE connections per host.
+    """
+    global _session, _session_pool_size
+    pool_size = settings.get_http_pool_size()
+    with _session_lock:
+        if _session is not None and _session_pool_size != pool_size:
+            _session.close()
+            _session = None
+
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers.update({'Connection': 'keep-alive'})
+            _session = session
+            _session_pool_size = pool_size
+        return _session
+
+_breaker = None
+_breaker_lock = threading.Lock()
+
+def get_circuit_breaker():
+    """
+    Process-wide circuit breaker guarding the punch upload endpoint.
+    Rebuilt when CIRCUIT_FAILURE_THRESHOLD / CIRCUIT_RESET_TIMEOUT change.
+    """
+    global _breaker
+    cfg = settings.get_settings()
+    with _breaker_lock:
+        if _breaker is None or (_breaker.failure_threshold, _breaker.reset_timeout) != (
+                max(1, cfg.circuit_failure_threshold), cfg.circuit_reset_timeout):
+            _breaker = CircuitBreaker(
+                failure_threshold=cfg.circuit_failure_threshold,
+                reset_timeout=cfg.circuit_reset_timeout,
+                name="tanhkapay-api",
+            )
+        return _breaker
+
+def reset_circuit_breaker():
+    """Drops the circuit breaker so the next upload starts from a closed one."""
+    global _breaker
+    with _breaker_lock:
+        _breaker = None
+
+def get_retry_policy(cfg=None):
+    cfg = cfg or settings.get_settings()
+    return RetryPolicy(
+        max_attempts=cfg.http_max_attempts,
+        base_delay=cfg.http_backoff_base,
+        max_delay=cfg.http_backoff_max,
+        retry_statuses=cfg.http_retry_statuses,
+    )
+
+def close_session():
+    global _session, _session_pool_size
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+        _session_pool_size = None
+
+def parse_txn_ids(value):
+    """
+    Normalizes successfullySavedTransactionIds to a list of strings.
+    The API may return either a JSON list or a comma separated (optionally range encoded) string.
+    """
+    if not value:
+        return []
+    if isinstance(value, str):
+        return decode_ranges(value)
+    if isinstance(value, (list, tuple)):
+        return [str(t).strip() for t in value if str(t).strip()]
+    return [str(value)]
+
+# The C# code does: var finalObj = "{\"punchingDetails\": " + result + "}";
+_ENVELOPE_PREFIX = b'{"punchingDetails": '
+_ENVELOPE_SUFFIX = b'}'
+_JSON_WHITESPACE = b' \t\r\n'
+
+def _looks_like_json(data):
+    """Cheap structure check of a JSON fragment: first/last significant bytes only, no full parse."""
+    start = 0
+    end = len(data)
+    while start < end and data[start] in _JSON_WHITESPACE:
+        start += 1
+    while end > start and data[end - 1] in _JSON_WHITESPACE:
+        end -= 1
+    if start == end:
+        return False
+    return (data[start], data[end - 1]) in ((ord('['), ord(']')), (ord('{'), ord('}')))
+
+def build_body_pieces(data):
+    """
+    Returns the punchingDetails envelope as a list of byte pieces around the punch data,
+    without copying the data itself.
+
+    `data` is either the JSON text from the DB (str/bytes) or a batch of already encoded
+    records (an object with `parts`, or a list of bytes). Batch records were validated
+    one by one by the streaming reader, so they are not parsed again here.
+    """
+    parts = getattr(data, 'parts', None)
+    if parts is None and isinstance(data, (list, tuple)):
+        parts = data
+
+    if parts is not None:
+        pieces = [_ENVELOPE_PREFIX, b'[']
+        for i, part in enumerate(parts):
+            if i:
+                pieces.append(b',')
+            pieces.append(part)
+        pieces.append(b']')
+        pieces.append(_ENVELOPE_SUFFIX)
+        return pieces
+
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    if not _looks_like_json(data):
+        logger.warning("Constructed payload is not valid JSON. Proceeding anyway but API might fail.")
+    return [_ENVELOPE_PREFIX, data, _ENVELOPE_SUFFIX]
+
+def send_punch_data(data, timings=None):
+    cfg = settings.get_settings()
+    api_url = cfg.tp_api_url
+    username = cfg.api_username
+    password = cfg.api_password
     
     if not all([api_url, username, password]):
         logger.error("API configuration missing/incomplete.")
         return {'success': False, 'message': 'Configuration incomplete'}
 
     try:
-        # Construct payload
-        # The C# code does: var finalObj = "{\"punchingDetails\": " + result + "}";
-        # We assume 'data' is already a JSON string from the DB, or we need to be careful.
-        # If 'data' is a JSON string, we should parse it to ensure validity or just embed it.
-        # Let's try to parse it to see if it's valid JSON, if not, treat as string?
-        # The C# code treats it as a string concatenation, implying 'result' is a valid JSON fragment (e.g., an array or object).
-        
-        # We'll stick to string manipulation to match C# logic exactly for now, 
-        # ensuring we don't double-escape if the DB returns a JSON string.
-        payload_str = '{"punchingDetails": ' + str(data) + '}'
-        
-        # Check if valid JSON
-        try:
-            json.loads(payload_str)
-        except json.JSONDecodeError:
-            logger.warning("Constructed payload is not valid JSON. Proceeding anyway but API might fail.")
-
-        headers = {
-            'Content-Type': 'application/json',
-            'Accept': 'application/json'
-        }
+        # Construct payload. The envelope is written around the DB buffer rather than
+        # concatenating, re-parsing and re-encoding it, so the body is built with a single copy.
+        with measure(timings, 'payload_build'):
+            pieces = build_body_pieces(data)
+
+            headers = {
+                'Content-Type': 'application/json',
+                'Accept': 'application/json'
+            }
+
+            body, encoding = maybe_compress(
+                pieces,
+                cfg.upload_compression,
+                cfg.upload_compression_min_bytes,
+                cfg.upload_compression_level,
+            )
+        if timings is not None:
+            timings.add_bytes('payload', sum(len(piece) for piece in pieces))
+            timings.add_bytes('request_body', len(body))
+            if hasattr(data, 'parts'):
+                timings.count('records_sent', len(data.parts))
+        if encoding:
+            headers['Content-Encoding'] = encoding
         
         # Basic Auth
         # requests.auth.HTTPBasicAuth could be used, but let's match C# manual header construction to be safe?
         # C#: Convert.ToBase64String(Encoding.UTF8.GetBytes($"{username}:{password}"))
         # requests does this automatically with auth=(username, password)
-        
-        logger.info(f"Sending data to {api_url}")
-        response = requests.post(
-            api_url, 
-            data=payload_str, 
-            headers=headers, 
-            auth=(username, password),
-            timeout=300 # ServicePointManager set connection limit, but not timeout explicitly in C# snippet? default is usually high.
-        )
-        
-        logger.info(f"API Response Status: {response.status_code}")
-        
-        if response.status_code == 200:
+
+        policy = get_retry_policy(cfg)
+        breaker = get_circuit_breaker()
+
+        for attempt in range(1, policy.max_attempts + 1):
+            # Concurrent uploads wait for a half-open probe rather than failing straight away
+            if not breaker.allow_request(probe_wait=cfg.http_read_timeout):
+                message = f"Circuit breaker open; API calls paused for {breaker.retry_in():.0f}s after repeated failures."
+                logger.warning(message)
+                return {'success': False, 'message': message}
+
+            retry_after = None
+            # Every exit from the attempt reports to the breaker, or a half-open probe is never released
+            outcome_recorded = False
             try:
-                response_json = response.json()
-                # C# logic:
-                # if (objJsonResult["message"].ToString().Substring(0, 24) == "Data Saved Successfully." && objJsonResult["commonData"].ToString() != "")
-                
-                message = response_json.get('message', '')
-                common_data = response_json.get('commonData')
-                
-                if message.startswith("Data Saved Successfully.") and common_data:
-                    # Parse commonData if it's a string (it seems to be JSON string inside JSON)
-                    if isinstance(common_data, str):
-                        common_data_json = json.loads(common_data)
-                    else:
-                        common_data_json = common_data
-                        
-                    txn_ids = common_data_json.get('successfullySavedTransactionIds')
-                    
-                    return {'success': True, 'txn_ids': txn_ids, 'message': message}
-                else:
-                    return {'success': False, 'message': message}
-                    
-            except Exception as e:
-                logger.error(f"Failed to parse API response: {e}")
-                return {'success': False, 'message': 'Invalid API Response'}
-        else:
-            return {'success': False, 'message': f"Http Error: {response.status_code}"}
+                logger.info(f"Sending data to {api_url}" + (f" (attempt {attempt}/{policy.max_attempts})" if attempt > 1 else ""))
+                if timings is not None:
+                    timings.count('http_requests')
+                metrics.BYTES_SENT.inc(len(body))
+                with measure(timings, 'http_send'):
+                    response = get_session().post(
+                        api_url,
+                        data=body,
+                        headers=headers,
+                        auth=(username, password),
+                        # (connect, read) - fail fast on unreachable hosts, but allow the API time to process a batch
+                        timeout=(cfg.http_connect_timeout, cfg.http_read_timeout)
+                    )
+            except requests.RequestException as e:
+                breaker.record_failure()
+                outcome_recorded = True
+                metrics.API_RESPONSES.inc(code='error')
+                result = {'success': False, 'message': str(e)}
+                logger.warning(f"API Request failed: {e}")
+                if not _never_sent(e):
+                    # The API may have received and saved the batch (e.g. a read timeout);
+                    # posting it again could duplicate punches, so leave it to the next cycle
+                    return result
+            else:
+                logger.info(f"API Response Status: {response.status_code}")
+                metrics.API_RESPONSES.inc(code=response.status_code)
+                if not policy.is_retryable_status(response.status_code):
+                    # Any definitive answer means the API is up, even if it rejected this request
+                    breaker.record_success()
+                    outcome_recorded = True
+                    with measure(timings, 'response_parse'):
+                        result = _parse_response(response)
+                    # Lets the outbox tell an outage from a rejected batch
+                    result['answered'] = True
+                    return result
+
+                breaker.record_failure()
+                outcome_recorded = True
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                result = {'success': False, 'message': f"Http Error: {response.status_code}"}
+            finally:
+                if not outcome_recorded:
+                    breaker.record_failure()
+
+            if attempt < policy.max_attempts:
+                delay = policy.delay(attempt, retry_after)
+                logger.info(f"Retrying upload in {delay:.1f}s...")
+                metrics.API_RETRIES.inc()
+                time.sleep(delay)
+
+        return result
 
     except Exception as e:
         logger.error(f"API Request failed: {e}")
         return {'success': False, 'message': str(e)}
+
+def _never_sent(error):
+    """True if a request failed before the connection was made, so repeating it cannot duplicate punches."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    if not isinstance(error, requests.ConnectionError) or not error.args:
+        return False
+    reason = getattr(error.args[0], 'reason', error.args[0])
+    return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+def _parse_response(response):
+    if response.status_code == 200:
+        try:
+            response_json = response.json()
+            # C# logic:
+            # if (objJsonResult["message"].ToString().Substring(0, 24) == "Data Saved Successfully." && objJsonResult["commonData"].ToString() != "")
+
+            message = response_json.get('message', '')
+            common_data = response_json.get('commonData')
+
+            if message.startswith("Data Saved Successfully.") and common_data:
+                # Parse commonData if it's a string (it seems to be JSON string inside JSON)
+                if isinstance(common_data, str):
+                    common_data_json = json.loads(common_data)
+                else:
+                    common_data_json = common_data
+
+                txn_ids = parse_txn_ids(common_data_json.get('successfullySavedTransactionIds'))
+
+                return {'success': True, 'txn_ids': txn_ids, 'message': message}
+            else:
+                return {'success': False, 'message': message}
+
+        except Exception as e:
+            logger.error(f"Failed to parse API response: {e}")
+            return {'success': False, 'message': 'Invalid API Response'}
+    else:
+        return {'success': False, 'message': f"Http Error: {response.status_code}"}
+
+def upload_batches(batches, workers=None, on_result=None, upload_fn=None, collect_ids=False):
+    """
+    Uploads batches with up to `workers` requests in flight at once.
+
+    Batches are pulled from the iterable lazily, so a streaming source is never read further
+    ahead than the number of in-flight requests. `on_result(batch, result)` is called on the
+    calling thread as each upload completes (in completion order), which keeps per-batch
+    handling such as acknowledgements single-threaded.
+
+    Returns a summary of batch counts. With collect_ids=True it also holds every returned
+    transaction id under 'txn_ids', for a consolidated acknowledgement; callers that settle
+    each batch in `on_result` should leave it off so the ids are not kept for the whole run.
+    """
+    upload_fn = upload_fn or send_punch_data
+    workers = max(1, workers or settings.get_upload_workers())
+
+    summary = {'batches': 0, 'failed_batches': 0, 'txn_ids': []}
+    pending = {}
+
+    def handle(future):
+        batch = pending.pop(future)
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.error(f"Upload of batch {getattr(batch, 'seq', '?')} raised: {e}")
+            result = {'success': False, 'message': str(e)}
+
+        if result and result.get('success'):
+            if collect_ids:
+                summary['txn_ids'].extend(result.get('txn_ids') or [])
+        else:
+            summary['failed_batches'] += 1
+        if on_result:
+            on_result(batch, result)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="punch-upload") as pool:
+        for batch in batches:
+            while len(pending) >= workers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    handle(future)
+
+            summary['batches'] += 1
+            logger.info(f"Uploading batch {getattr(batch, 'seq', summary['batches'])} "
+                        f"({len(batch)} records) [{len(pending) + 1}/{workers} in flight]")
+            pending[pool.submit(upload_fn, batch)] = batch
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                handle(future)
+
+    return summary
@@ -0,0 +1,314 @@
+
+import time
+import asyncio
+import logging
+import threading
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+from config import settings
+
+try:
+    from src.main import prepare_sync, build_sync_result, open_batch_source
+    from src.database import update_sync_status, log_pool_stats
+    from src.api_client import send_punch_data
+    from src.txn_ranges import summarize_ids
+    from src.timings import SyncTimings
+    from src import metrics
+except ImportError:
+    # Fallback for frozen executable where src might be flattened
+    from main import prepare_sync, build_sync_result, open_batch_source
+    from database import update_sync_status, log_pool_stats
+    from api_client import send_punch_data
+    from txn_ranges import summarize_ids
+    from timings import SyncTimings
+    import metrics
+
+logger = logging.getLogger("PaythonProgram")
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Shared worker threads for the blocking pyodbc and HTTP calls made by the async engine.
+    Created once and reused, so a sync cycle never creates threads of its own.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.get_upload_workers() + 2,
+                thread_name_prefix="async-sync-io",
+            )
+        return _executor
+
+
+class AsyncDatabase:
+    """Executor-backed async wrapper around the pyodbc functions in database.py."""
+
+    def __init__(self, executor=None):
+        self.executor = executor or get_executor()
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def open_batch_source(self, log, timings=None):
+        return await self._run(open_batch_source, log, timings)
+
+    async def iter_batches(self, batches):
+        """
+        Async generator over a blocking batch source. The streaming reader is advanced one
+        batch at a time on a worker thread, so the event loop is never blocked on the DB.
+        """
+        try:
+            while True:
+                batch = await self._run(next, batches, None)
+                if batch is None:
+                    return
+                yield batch
+        finally:
+            # Release the pooled connection held by the reader
+            await self._run(batches.close)
+
+    async def settle(self, source, batch, saved_txn_ids):
+        await self._run(source.settle, batch, saved_txn_ids)
+
+    async def finish_batch_source(self, source, log):
+        if source is not None:
+            await self._run(source.finish, log)
+
+    async def update_sync_status(self, txn_ids, timings=None):
+        return await self._run(partial(update_sync_status, txn_ids, timings=timings))
+
+
+class AsyncApiClient:
+    """
+    Async facade over api_client.send_punch_data. Requests run on the shared executor
+    through the same keep-alive session, retry and compression handling as the threaded
+    engine.
+    """
+
+    def __init__(self, executor=None):
+        self.executor = executor or get_executor()
+
+    async def send_punch_data(self, batch, timings=None):
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, partial(send_punch_data, batch, timings=timings))
+
+
+async def run_sync_async(timings=None):
+    """
+    asyncio implementation of run_sync(). Returns the same {'success', 'message', 'timings'} dict.
+    """
+    timings = timings or SyncTimings()
+    with timings.stage('config_load'):
+        logger = prepare_sync()
+
+    db = AsyncDatabase()
+    api = AsyncApiClient()
+    workers = settings.get_upload_workers()
+    consolidate = settings.get_ack_mode() == 'consolidated'
+
+    batch_queue = asyncio.Queue(maxsize=max(1, settings.get_pipeline_queue_size()))
+    summary = {'total_batches': 0, 'failed_batches': 0, 'synced_count': 0, 'last_error': None, 'reader_failed': False}
+    consolidated_ids = []
+    consolidated_batches = []
+    reader_error = None
+    source = None
+
+    def record_failure(message):
+        summary['failed_batches'] += 1
+        summary['last_error'] = message
+
+    async def acknowledge(label, txn_ids):
+        logger.info(f"Records of {label} synced. Updating status for {len(txn_ids)} txn ids: {summarize_ids(txn_ids)}")
+        try:
+            update_result = await db.update_sync_status(txn_ids, timings)
+        except Exception as e:
+            logger.warning(f"Records of {label} synced but failed to update database status: {e}")
+            record_failure(str(e))
+            return False
+        if update_result:
+            summary['synced_count'] += len(txn_ids)
+            return True
+        logger.warning(f"Records of {label} synced but failed to update database status.")
+        record_failure("Failed to update database status.")
+        return False
+
+    async def settle(batch, txn_ids):
+        # A failure here must not take down the uploader, or the reader blocks on a full queue
+        try:
+            await db.settle(source, batch, txn_ids)
+        except Exception as e:
+            logger.error(f"Recording the outcome of batch {batch.seq} failed: {e}")
+
+    async def reader(batches):
+        nonlocal reader_error
+        try:
+            async for batch in db.iter_batches(batches):
+                summary['total_batches'] += 1
+                await batch_queue.put(batch)
+        except Exception as e:
+            logger.error(f"Reading punch data failed: {e}")
+            reader_error = e
+            # Not a batch of its own, so it is reported apart from failed_batches
+            summary['reader_failed'] = True
+            summary['last_error'] = str(e)
+        finally:
+            for _ in range(workers):
+                await batch_queue.put(None)
+
+    async def uploader():
+        while True:
+            batch = await batch_queue.get()
+            if batch is None:
+                return
+            logger.info(f"Uploading batch {batch.seq} ({len(batch)} records)")
+            try:
+                api_result = await api.send_punch_data(batch, timings)
+            except Exception as e:
+                api_result = {'success': False, 'message': str(e)}
+            source.uploaded(batch, api_result)
+
+            if not (api_result and api_result.get('success')):
+                message = api_result.get('message') if api_result else 'Unknown error'
+                logger.error(f"API Sync failed for batch {batch.seq}. Message: {message}")
+                record_failure(message)
+                await settle(batch, None)
+                continue
+
+            txn_ids = api_result.get('txn_ids')
+            if not txn_ids:
+                logger.warning(f"API returned success but no transaction IDs for batch {batch.seq}.")
+                await settle(batch, [])
+            elif consolidate:
+                consolidated_ids.extend(txn_ids)
+                consolidated_batches.append((batch, txn_ids))
+            else:
+                acked = await acknowledge(f"batch {batch.seq}", txn_ids)
+                await settle(batch, txn_ids if acked else None)
+
+    try:
+        logger.info("Fetching data from database...")
+        source = await db.open_batch_source(logger, timings)
+        await asyncio.gather(reader(source.batches), *(uploader() for _ in range(workers)))
+
+        if reader_error is not None and summary['total_batches'] == 0:
+            raise reader_error
+        if consolidated_ids:
+            acked = await acknowledge("all batches", consolidated_ids)
+            for batch, txn_ids in consolidated_batches:
+                await settle(batch, txn_ids if acked else None)
+
+        timings.count('batches', summary['total_batches'])
+        timings.count('synced_records', summary['synced_count'])
+        result = build_sync_result(summary, logger)
+
+    except Exception as e:
+        logger.exception(f"An unexpected error occurred: {e}")
+        result = {'success': False, 'message': f"An unexpected error occurred: {e}"}
+    finally:
+        await db.finish_batch_source(source, logger)
+        log_pool_stats(logger)
+        timings.finish()
+        logger.info(timings.log_line())
+
+    metrics.record_sync(result, timings)
+    result['timings'] = timings.as_dict()
+    return result
+
+
+class AsyncScheduler:
+    """
+    Event-loop-hosted scheduler. One background thread runs an asyncio loop that fires
+    each registered job every `interval` seconds, so any number of jobs (e.g. one per
+    configured site) are driven without a thread per sync.
+
+    A job is an async callable; a run is skipped if the previous run of the same job
+    is still in progress.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        self._jobs = {}
+        self._started = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._started.clear()
+        self._thread = threading.Thread(target=self._run_loop, name="async-scheduler", daemon=True)
+        self._thread.start()
+        self._started.wait()
+
+    def stop(self, timeout=None):
+        if not self.running:
+            return
+        self._jobs.clear()
+        try:
+            asyncio.run_coroutine_threadsafe(self._cancel_all(), self._loop).result(timeout)
+        except Exception as e:
+            logger.warning(f"Scheduler did not shut down cleanly: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def add_job(self, name, coro_fn, interval, run_immediately=False):
+        """Schedules `coro_fn()` every `interval` seconds. Replaces an existing job with the same name."""
+        self.start()
+        self.remove_job(name)
+        future = asyncio.run_coroutine_threadsafe(
+            self._job_loop(name, coro_fn, interval, run_immediately), self._loop)
+        self._jobs[name] = future
+
+    def remove_job(self, name):
+        future = self._jobs.pop(name, None)
+        if future is not None:
+            future.cancel()
+
+    def run_now(self, coro_fn=run_sync_async):
+        """Runs a coroutine on the scheduler loop. Returns a concurrent.futures.Future."""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro_fn(), self._loop)
+
+    def _run_loop(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._started.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._loop.close()
+
+    async def _cancel_all(self):
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _job_loop(self, name, coro_fn, interval, run_immediately):
+        next_run = time.monotonic() + (0 if run_immediately else interval)
+        task = None
+        while True:
+            await asyncio.sleep(max(0, next_run - time.monotonic()))
+            metrics.SCHEDULER_LAG.observe(max(0.0, time.monotonic() - next_run))
+            next_run += interval
+            if task is not None and not task.done():
+                logger.warning(f"Scheduled job '{name}' is still running. Skipping this run.")
+                continue
+            task = asyncio.ensure_future(self._run_job(name, coro_fn))
+
+    async def _run_job(self, name, coro_fn):
+        try:
+            result = await coro_fn()
+            if isinstance(result, dict):
+                logger.info(f"Scheduled job '{name}' finished: {result.get('message')}")
+        except Exception as e:
+            logger.error(f"Scheduled job '{name}' failed: {e}")
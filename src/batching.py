@@ -0,0 +1,70 @@
+
+import json
+
+# '[' + ']' around the records plus one ',' between each pair
+_ARRAY_OVERHEAD = 2
+
+
+class PunchBatch:
+    """A group of punch records uploaded (and acknowledged) as one API request."""
+
+    def __init__(self, seq):
+        self.seq = seq
+        self.parts = []      # UTF-8 encoded JSON text of each record
+        self.keys = []       # Caller supplied key per record (keyed batching only)
+        self.byte_size = _ARRAY_OVERHEAD
+        self.outbox_batch_id = None
+
+    def __len__(self):
+        return len(self.parts)
+
+    def add(self, part, key=None):
+        if self.parts:
+            self.byte_size += 1
+        self.parts.append(part)
+        self.keys.append(key)
+        self.byte_size += len(part)
+
+    def size_with(self, part):
+        return self.byte_size + len(part) + (1 if self.parts else 0)
+
+    def payload(self):
+        """Returns the batch as a JSON array (bytes), ready to embed in the punchingDetails envelope."""
+        return b'[' + b','.join(self.parts) + b']'
+
+
+def _encode_record(record):
+    if isinstance(record, bytes):
+        return record
+    if isinstance(record, str):
+        return record.encode('utf-8')
+    return json.dumps(record, separators=(',', ':')).encode('utf-8')
+
+
+def iter_batches(records, max_records=1000, max_bytes=2 * 1024 * 1024, keyed=False):
+    """
+    Groups punch records into batches capped by record count and encoded byte size.
+
+    `records` may yield dicts, JSON text or UTF-8 bytes. With `keyed=True` it yields
+    (key, record) pairs instead and the keys are kept in `batch.keys`. Batches are
+    produced as soon as they fill up, so the first one can be uploaded while later
+    records are still being read. A single record larger than `max_bytes` is sent in
+    a batch of its own.
+    """
+    max_records = max(1, max_records)
+    seq = 1
+    batch = PunchBatch(seq)
+
+    for record in records:
+        key = None
+        if keyed:
+            key, record = record
+        part = _encode_record(record)
+        if batch.parts and (len(batch) >= max_records or batch.size_with(part) > max_bytes):
+            yield batch
+            seq += 1
+            batch = PunchBatch(seq)
+        batch.add(part, key)
+
+    if batch.parts:
+        yield batch
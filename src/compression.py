@@ -0,0 +1,85 @@
+
+import zlib
+import time
+import logging
+
+try:
+    import zstandard
+except ImportError:
+    # Optional dependency; zstd compression is only offered when it is installed
+    zstandard = None
+
+logger = logging.getLogger("PaythonProgram")
+
+SUPPORTED_METHODS = ('gzip', 'deflate', 'zstd')
+
+_warned_zstd = False
+
+
+def resolve_method(method):
+    """Returns the usable compression method for a configured value, or None for no compression."""
+    global _warned_zstd
+    method = (method or '').strip().lower()
+    if method in ('', 'none', 'off', 'false', '0'):
+        return None
+    if method == 'zstd' and zstandard is None:
+        if not _warned_zstd:
+            logger.warning("UPLOAD_COMPRESSION=zstd but the 'zstandard' package is not installed. Sending uncompressed.")
+            _warned_zstd = True
+        # The API was configured for zstd, so don't assume it also accepts gzip
+        return None
+    if method not in SUPPORTED_METHODS:
+        logger.warning(f"Unknown UPLOAD_COMPRESSION '{method}'. Sending uncompressed.")
+        return None
+    return method
+
+
+def _compressor(method, level):
+    if method == 'gzip':
+        # wbits=31 -> gzip container
+        return zlib.compressobj(level, zlib.DEFLATED, 31)
+    if method == 'deflate':
+        # HTTP "deflate" is the zlib-wrapped format
+        return zlib.compressobj(level, zlib.DEFLATED, 15)
+    if method == 'zstd':
+        return zstandard.ZstdCompressor(level=level).compressobj()
+    raise ValueError(f"Unsupported compression method: {method}")
+
+
+def compress(pieces, method, level=6):
+    """
+    Compresses a request body given as bytes or as a list of byte pieces, feeding the
+    pieces straight into the compressor so the uncompressed body is never assembled.
+    Returns (compressed_bytes, content_encoding, seconds_taken).
+    """
+    if isinstance(pieces, (bytes, bytearray, memoryview)):
+        pieces = [pieces]
+
+    start = time.perf_counter()
+    compressor = _compressor(method, level)
+    out = [compressor.compress(piece) for piece in pieces]
+    out.append(compressor.flush())
+    return b''.join(out), method, time.perf_counter() - start
+
+
+def maybe_compress(pieces, method, min_bytes, level=6):
+    """
+    Builds the request body from `pieces` (bytes or a list of bytes), compressing it when
+    a method is configured and the raw size is at least `min_bytes`.
+    Returns (body, content_encoding_or_None).
+    """
+    if isinstance(pieces, (bytes, bytearray, memoryview)):
+        pieces = [pieces]
+    raw_size = sum(len(piece) for piece in pieces)
+
+    method = resolve_method(method)
+    if method is None or raw_size < min_bytes:
+        return b''.join(pieces), None
+
+    compressed, encoding, elapsed = compress(pieces, method, level)
+    ratio = len(compressed) / raw_size if raw_size else 1.0
+    logger.info(
+        f"Compressed request body with {encoding}: {raw_size} -> {len(compressed)} bytes "
+        f"({ratio:.1%}) in {elapsed * 1000:.1f} ms"
+    )
+    return compressed, encoding
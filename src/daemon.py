@@ -0,0 +1,186 @@
+
+import os
+import time
+import signal
+import socket
+import logging
+import threading
+
+try:
+    from src import metrics
+except ImportError:
+    # Fallback for frozen executable where src might be flattened
+    import metrics
+
+logger = logging.getLogger("PaythonProgram")
+
+
+def sd_notify(state):
+    """
+    Sends a state string (e.g. "READY=1") to systemd over $NOTIFY_SOCKET.
+    Returns False when not running under a Type=notify unit.
+    """
+    address = os.getenv('NOTIFY_SOCKET')
+    if not address or not hasattr(socket, 'AF_UNIX'):
+        return False
+    if address.startswith('@'):
+        # Abstract namespace socket
+        address = '\0' + address[1:]
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.connect(address)
+            sock.sendall(state.encode('utf-8'))
+        return True
+    except OSError as e:
+        logger.warning(f"systemd notification failed: {e}")
+        return False
+
+
+def watchdog_interval():
+    """Seconds between watchdog pings (half of WatchdogSec), or None if the watchdog is off."""
+    usec = os.getenv('WATCHDOG_USEC')
+    pid = os.getenv('WATCHDOG_PID')
+    if not usec or (pid and pid != str(os.getpid())):
+        return None
+    try:
+        return max(0.5, int(usec) / 1e6 / 2)
+    except ValueError:
+        return None
+
+
+class SyncDaemon:
+    """
+    Runs sync cycles on a fixed interval inside one long-lived process, so the
+    interpreter, configuration, DB pool and HTTP session are set up once.
+
+    Each cycle runs on a worker thread while the main thread keeps the systemd
+    watchdog fed. Once a cycle has run longer than `cycle_timeout_fn()` seconds (e.g. a
+    query hung, as pyodbc has no query timeout) the pings stop, so systemd restarts the
+    service. SIGTERM/SIGINT let a running cycle finish before exiting; SIGHUP reloads
+    the configuration between cycles.
+    """
+
+    def __init__(self, run_fn, reload_fn, interval_fn, shutdown_fn=None, stop_timeout=None,
+                 cycle_timeout_fn=None, log=None):
+        self.run_fn = run_fn
+        self.reload_fn = reload_fn
+        self.interval_fn = interval_fn
+        self.shutdown_fn = shutdown_fn
+        self.stop_timeout = stop_timeout
+        self.cycle_timeout_fn = cycle_timeout_fn
+        self.log = log or logger
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._reload_requested = False
+        self._cycle = None
+        self._cycle_started = None
+        self._hung_reported = False
+
+    def request_stop(self, *_):
+        self._stopping = True
+        self._wakeup.set()
+
+    def request_reload(self, *_):
+        self._reload_requested = True
+        self._wakeup.set()
+
+    def install_signal_handlers(self):
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGINT, self.request_stop)
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, self.request_reload)
+
+    def _cycle_running(self):
+        return self._cycle is not None and self._cycle.is_alive()
+
+    def _cycle_hung(self):
+        """True once the running cycle has exceeded the cycle timeout (logged the first time)."""
+        if self.cycle_timeout_fn is None or not self._cycle_running():
+            return False
+        limit = self.cycle_timeout_fn()
+        elapsed = time.monotonic() - self._cycle_started
+        if not limit or elapsed < limit:
+            return False
+        if not self._hung_reported:
+            self._hung_reported = True
+            self.log.error(f"Sync cycle has been running for {elapsed:.0f}s, over the {limit:.0f}s limit. "
+                           f"Stopping watchdog pings so the service is restarted.")
+        return True
+
+    def _ping_watchdog(self, ping_every):
+        if ping_every and not self._cycle_hung():
+            sd_notify("WATCHDOG=1")
+
+    def _run_cycle(self):
+        try:
+            result = self.run_fn()
+            if isinstance(result, dict):
+                self.log.info(f"Daemon sync cycle finished: {result.get('message')}")
+        except Exception as e:
+            self.log.exception(f"Daemon sync cycle failed: {e}")
+        finally:
+            self._wakeup.set()
+
+    def _reload(self):
+        self._reload_requested = False
+        sd_notify(f"RELOADING=1\nMONOTONIC_USEC={time.monotonic_ns() // 1000}")
+        try:
+            self.reload_fn()
+            self.log.info(f"Configuration reloaded. Sync interval is {self.interval_fn()} min.")
+        except Exception as e:
+            self.log.error(f"Configuration reload failed, keeping previous settings: {e}")
+        sd_notify("READY=1")
+
+    def run(self):
+        self.install_signal_handlers()
+        ping_every = watchdog_interval()
+        next_run = time.monotonic()
+
+        sd_notify("READY=1")
+        self.log.info(f"Daemon started. Sync interval is {self.interval_fn()} min.")
+
+        while not self._stopping:
+            if self._reload_requested and not self._cycle_running():
+                self._reload()
+                next_run = min(next_run, time.monotonic() + self.interval_fn() * 60)
+
+            now = time.monotonic()
+            if now >= next_run:
+                if self._cycle_running():
+                    self.log.warning("Previous sync cycle still running. Skipping this run.")
+                else:
+                    metrics.SCHEDULER_LAG.observe(now - next_run)
+                    self._cycle = threading.Thread(target=self._run_cycle, name="daemon-sync", daemon=True)
+                    self._cycle_started = now
+                    self._hung_reported = False
+                    self._cycle.start()
+                next_run = now + self.interval_fn() * 60
+
+            timeout = max(0.0, next_run - time.monotonic())
+            if ping_every:
+                self._ping_watchdog(ping_every)
+                timeout = min(timeout, ping_every)
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()
+
+        self._drain(ping_every)
+
+    def _drain(self, ping_every):
+        sd_notify("STOPPING=1")
+        if self._cycle_running():
+            self.log.info("Stop requested. Waiting for the running sync cycle to finish...")
+            deadline = None if self.stop_timeout is None else time.monotonic() + self.stop_timeout
+            while self._cycle.is_alive():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self.log.warning("Sync cycle did not finish before the stop timeout. Exiting anyway.")
+                    break
+                self._ping_watchdog(ping_every)
+                wait = ping_every or 1.0
+                self._cycle.join(wait if remaining is None else min(wait, remaining))
+        if self.shutdown_fn is not None:
+            try:
+                self.shutdown_fn()
+            except Exception as e:
+                self.log.error(f"Shutdown cleanup failed: {e}")
+        self.log.info("Daemon stopped.")
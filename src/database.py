@@ -3,18 +3,59 @@
 # import pyodbc # Moved inside function
 
 import os
+import time
 import logging
+import threading
+from contextlib import contextmanager
 
 from config import settings
 
+try:
+    from src.db_pool import ConnectionPool
+    from src.json_stream import iter_json_array
+    from src.txn_ranges import encode_ranges, decode_ranges
+    from src.timings import measure
+    from src import metrics
+    from src import sqlite_backend
+except ImportError:
+    # Fallback for frozen executable where src might be flattened
+    from db_pool import ConnectionPool
+    from json_stream import iter_json_array
+    from txn_ranges import encode_ranges, decode_ranges
+    from timings import measure
+    import metrics
+    import sqlite_backend
+
 logger = logging.getLogger("PaythonProgram")
 
+_pool = None
+_pool_conn_str = None
+_pool_lock = threading.Lock()
+
+def _connect_sqlserver(cfg):
+    import pyodbc
+    return pyodbc.connect(cfg.db_connection_string)
+
+def _connect_sqlite(cfg):
+    # Local stand-in that emulates uspManageBioPunchesData, for profiling without SQL Server
+    return sqlite_backend.connect(cfg.sqlite_path)
+
+# DB_BACKEND -> connection factory. Connections expose the pyodbc cursor interface.
+_BACKENDS = {
+    'sqlserver': _connect_sqlserver,
+    'sqlite': _connect_sqlite,
+}
+
+def _backend_key(cfg):
+    """Identifies the database a pool connects to; the pool is rebuilt when it changes."""
+    if cfg.db_backend == 'sqlite':
+        return f"sqlite:{os.path.abspath(cfg.sqlite_path)}"
+    return cfg.db_connection_string
+
 def get_db_connection():
-    conn_str = settings.get_db_connection_string()
+    cfg = settings.get_settings()
     try:
-        import pyodbc
-        conn = pyodbc.connect(conn_str)
-        return conn
+        return _BACKENDS[cfg.db_backend](cfg)
     except ImportError:
         logger.error("pyodbc module not found. Database features unavailable.")
         raise
@@ -22,52 +63,193 @@ def get_db_connection():
         logger.error(f"Database connection failed: {e}")
         raise
 
-def get_bio_punches_data():
-    conn = None
+def get_pool():
+    """
+    Returns the process-wide connection pool, creating and warming it on first use.
+    The pool is rebuilt if the connection string changed (e.g. config saved from the UI).
+    """
+    global _pool, _pool_conn_str
+    cfg = settings.get_settings()
+    conn_str = _backend_key(cfg)
+    created = None
+    with _pool_lock:
+        if _pool is not None and _pool_conn_str != conn_str:
+            logger.info("Database configuration changed. Recreating connection pool.")
+            _pool.close()
+            _pool = None
+
+        if _pool is None:
+            _pool = ConnectionPool(
+                get_db_connection,
+                min_size=cfg.db_pool_min_size,
+                max_size=cfg.db_pool_max_size,
+                idle_timeout=cfg.db_pool_idle_timeout,
+                max_lifetime=cfg.db_pool_max_lifetime,
+                borrow_timeout=cfg.db_pool_borrow_timeout,
+            )
+            _pool_conn_str = conn_str
+            created = _pool
+        pool = _pool
+
+    if created is not None:
+        # Warm up to DB_POOL_MIN_SIZE outside the lock; a failure here is retried on first borrow
+        try:
+            created.prefill()
+        except Exception as e:
+            logger.warning(f"Could not pre-open database connections: {e}")
+    return pool
+
+def close_pool():
+    global _pool, _pool_conn_str
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        _pool = None
+        _pool_conn_str = None
+
+def log_pool_stats(log=None):
+    with _pool_lock:
+        pool = _pool
+    if pool is not None:
+        pool.log_stats(log)
+
+@contextmanager
+def pooled_connection():
+    with get_pool().connection() as conn:
+        yield conn
+
+def iter_bio_punches_chunks(arraysize=None, after=None, timings=None):
+    """
+    Streams the raw `FOR JSON` text of uspManageBioPunchesData('getBioPunchesData').
+    SQL Server splits the JSON across many rows, so each yielded string is only a fragment.
+    With `after` set, only punches beyond that watermark are read (INCREMENTAL_FETCH_ACTION).
+    """
+    arraysize = arraysize or settings.get_db_fetch_arraysize()
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Equivalent to: cmd.Parameters.Add("@action", SqlDbType.VarChar, 500).Value = "getBioPunchesData";
-        sql = "{CALL uspManageBioPunchesData (?)}"
-        params = ('getBioPunchesData',)
-        
-        cursor.execute(sql, params)
-        
-        row = cursor.fetchone()
-        if row:
-            return row[0] # Assuming data is in the first column
-        return None
-        
+        borrow_started = time.perf_counter()
+        with pooled_connection() as conn:
+            if timings is not None:
+                timings.add('db_connect', time.perf_counter() - borrow_started)
+            cursor = conn.cursor()
+            try:
+                cursor.arraysize = arraysize
+
+                if after is None:
+                    # Equivalent to: cmd.Parameters.Add("@action", SqlDbType.VarChar, 500).Value = "getBioPunchesData";
+                    sql = "{CALL uspManageBioPunchesData (?)}"
+                    params = ('getBioPunchesData',)
+                else:
+                    # The watermark travels in the @txnIds parameter used by UpdateBioSyncData
+                    sql = "{CALL uspManageBioPunchesData (?, ?)}"
+                    params = (settings.get_incremental_fetch_action(), str(after))
+
+                with measure(timings, 'sp_execute'):
+                    cursor.execute(sql, params)
+
+                while True:
+                    with measure(timings, 'result_fetch'):
+                        rows = cursor.fetchmany(arraysize)
+                    if not rows:
+                        break
+                    fetched_bytes = sum(len(row[0]) for row in rows if row[0])
+                    metrics.DB_BYTES_FETCHED.inc(fetched_bytes)
+                    if timings is not None:
+                        timings.count('db_rows', len(rows))
+                        timings.add_bytes('db_result', fetched_bytes)
+                    for row in rows:
+                        if row[0]:
+                            yield row[0] # Assuming data is in the first column
+            finally:
+                cursor.close()
+
     except Exception as e:
         logger.error(f"Error fetching bio punches data: {e}")
         raise
-    finally:
-        if conn:
-            conn.close()
 
-def update_sync_status(txn_ids):
-    conn = None
+def iter_bio_punches_records(arraysize=None, raw=False, after=None, timings=None):
+    """
+    Yields punch records one by one as the result set is read, so memory stays flat
+    regardless of backlog size. With raw=True each record's JSON text is yielded instead.
+    """
+    return iter_json_array(iter_bio_punches_chunks(arraysize, after=after, timings=timings), raw=raw)
+
+def get_bio_punches_data():
+    # Concatenate every FOR JSON row; fetchone() alone truncates results larger than ~2 KB
+    data = "".join(iter_bio_punches_chunks())
+    return data or None
+
+def _ack_procedure(cursor, chunk):
+    # Equivalent to:
+    # cmd.Parameters.Add("@action", SqlDbType.VarChar, 500).Value = "UpdateBioSyncData";
+    # cmd.Parameters.Add("@txnIds", SqlDbType.VarChar,int.MaxValue).Value = transIds;
+    if settings.get_ack_txn_encoding() == 'ranges':
+        txn_ids = encode_ranges(chunk)
+    else:
+        txn_ids = ",".join(chunk)
+    sql = "{CALL uspManageBioPunchesData (?, ?)}"
+    params = ('UpdateBioSyncData', txn_ids)
+    cursor.execute(sql, params)
+
+def _ack_tvp(cursor, chunk):
+    # The procedure takes a single table-valued parameter with one txnId column
+    procedure = settings.get_ack_tvp_procedure()
+    cursor.execute(f"{{CALL {procedure} (?)}}", ([(txn_id,) for txn_id in chunk],))
+
+def _ack_staging(cursor, chunk):
+    # Bulk insert into a session temp table, then let the procedure join against it
+    cursor.execute("IF OBJECT_ID('tempdb..#BioSyncAck') IS NULL "
+                   "CREATE TABLE #BioSyncAck (txnId VARCHAR(50) NOT NULL PRIMARY KEY)")
+    cursor.fast_executemany = True
+    cursor.executemany("INSERT INTO #BioSyncAck (txnId) VALUES (?)", [(txn_id,) for txn_id in chunk])
+    cursor.execute("{CALL uspManageBioPunchesData (?, ?)}", (settings.get_ack_staging_action(), None))
+    cursor.execute("TRUNCATE TABLE #BioSyncAck")
+
+_ACK_METHODS = {
+    'procedure': _ack_procedure,
+    'tvp': _ack_tvp,
+    'staging': _ack_staging,
+}
+
+def update_sync_status(txn_ids, timings=None):
+    """
+    Marks the given transaction ids (a list, or a comma separated / range encoded string)
+    as synced. Ids are sent in chunks of ACK_CHUNK_SIZE, each committed in its own short
+    transaction, using ACK_METHOD. If a chunk fails the error is raised; chunks already
+    committed stay acknowledged.
+    """
+    if isinstance(txn_ids, str):
+        txn_ids = decode_ranges(txn_ids)
+    txn_ids = [str(t) for t in txn_ids]
+
+    cfg = settings.get_settings()
+    method = cfg.ack_method
+    ack_fn = _ACK_METHODS[method]
+    chunk_size = cfg.ack_chunk_size
+    chunk_count = (len(txn_ids) + chunk_size - 1) // chunk_size
+
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Equivalent to: 
-        # cmd.Parameters.Add("@action", SqlDbType.VarChar, 500).Value = "UpdateBioSyncData";
-        # cmd.Parameters.Add("@txnIds", SqlDbType.VarChar,int.MaxValue).Value = transIds;
-        
-        sql = "{CALL uspManageBioPunchesData (?, ?)}"
-        params = ('UpdateBioSyncData', txn_ids)
-        
-        cursor.execute(sql, params)
-        conn.commit()
-        
-        return True
-        return None
+        borrow_started = time.perf_counter()
+        with pooled_connection() as conn:
+            if timings is not None:
+                timings.add('db_connect', time.perf_counter() - borrow_started)
+            cursor = conn.cursor()
+            try:
+                for number, start in enumerate(range(0, len(txn_ids), chunk_size), 1):
+                    chunk = txn_ids[start:start + chunk_size]
+                    started = time.perf_counter()
+                    ack_fn(cursor, chunk)
+                    conn.commit()
+                    metrics.IDS_ACKNOWLEDGED.inc(len(chunk))
+                    if timings is not None:
+                        timings.add('ack', time.perf_counter() - started)
+                        timings.count('acked_ids', len(chunk))
+                    logger.info(f"Acknowledged chunk {number}/{chunk_count} ({len(chunk)} ids, {method}) "
+                                f"in {(time.perf_counter() - started) * 1000:.1f} ms")
+            finally:
+                cursor.close()
+
+            return True
 
     except Exception as e:
         logger.error(f"Error updating sync status: {e}")
         raise
-    finally:
-        if conn:
-            conn.close()
@@ -0,0 +1,268 @@
+
+import time
+import threading
+import logging
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger("PaythonProgram")
+
+
+class PoolExhaustedError(Exception):
+    """Raised when no connection could be borrowed within the borrow timeout."""
+    pass
+
+
+class _PooledConnection:
+    """Bookkeeping wrapper around a raw DB-API connection."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+    def age(self, now):
+        return now - self.created_at
+
+    def idle_for(self, now):
+        return now - self.last_used
+
+
+class ConnectionPool:
+    """
+    Small thread-safe pool of DB-API connections.
+
+    Connections are created by `connect_fn`, checked with a cheap query before being
+    handed out, evicted after `idle_timeout` seconds without use and recycled once
+    they are older than `max_lifetime` seconds. A warm pool lets a sync cycle run
+    without paying the TCP + TDS login handshake again.
+    """
+
+    def __init__(self, connect_fn, min_size=1, max_size=5, idle_timeout=300,
+                 max_lifetime=1800, borrow_timeout=30, health_check_sql="SELECT 1"):
+        self.connect_fn = connect_fn
+        self.min_size = max(0, min_size)
+        self.max_size = max(1, max_size, self.min_size)
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.borrow_timeout = borrow_timeout
+        self.health_check_sql = health_check_sql
+
+        self._idle = deque()
+        self._in_use = 0
+        self._checked_out_map = {}  # id(raw connection) -> wrapper, for borrowed connections
+        self._closed = False
+        self._cond = threading.Condition()
+
+        self._stats = {
+            'borrows': 0,
+            'hits': 0,
+            'creates': 0,
+            'health_check_failures': 0,
+            'evicted_idle': 0,
+            'evicted_lifetime': 0,
+            'borrow_wait_total': 0.0,
+            'borrow_wait_max': 0.0,
+        }
+
+    # --- Borrow / Return ---
+
+    @contextmanager
+    def connection(self):
+        """Borrows a connection for the duration of a `with` block."""
+        conn = self.borrow()
+        broken = False
+        try:
+            yield conn
+        except Exception:
+            broken = True
+            raise
+        finally:
+            self.release(conn, broken=broken)
+
+    def borrow(self):
+        start = time.monotonic()
+        deadline = start + self.borrow_timeout
+
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolExhaustedError("Connection pool is closed.")
+
+                self._evict_expired_locked()
+
+                if self._idle:
+                    pooled = self._idle.pop()
+                    self._in_use += 1
+                    break
+
+                if self._size_locked() < self.max_size:
+                    pooled = None
+                    self._in_use += 1
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolExhaustedError(
+                        f"Timed out after {self.borrow_timeout}s waiting for a database connection.")
+                self._cond.wait(remaining)
+
+        # Health check / create outside the lock so slow logins don't block other borrowers
+        try:
+            if pooled is not None and not self._is_healthy(pooled.raw):
+                with self._cond:
+                    self._stats['health_check_failures'] += 1
+                self._close_quietly(pooled.raw)
+                pooled = None
+
+            hit = pooled is not None
+            if pooled is None:
+                pooled = _PooledConnection(self.connect_fn())
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        waited = time.monotonic() - start
+        with self._cond:
+            self._stats['borrows'] += 1
+            if hit:
+                self._stats['hits'] += 1
+            else:
+                self._stats['creates'] += 1
+            self._stats['borrow_wait_total'] += waited
+            self._stats['borrow_wait_max'] = max(self._stats['borrow_wait_max'], waited)
+
+        self._checked_out(pooled)
+        return pooled.raw
+
+    def release(self, conn, broken=False):
+        pooled = self._checked_in(conn)
+        if pooled is None:
+            # Not one of ours; just close it
+            self._close_quietly(conn)
+            return
+
+        if not broken:
+            try:
+                # Never hand out a connection with an open transaction
+                conn.rollback()
+            except Exception:
+                broken = True
+
+        now = time.monotonic()
+        with self._cond:
+            self._in_use -= 1
+            if broken or self._closed or pooled.age(now) >= self.max_lifetime:
+                if not broken and not self._closed:
+                    self._stats['evicted_lifetime'] += 1
+                to_close = pooled
+            else:
+                pooled.last_used = now
+                self._idle.append(pooled)
+                to_close = None
+            self._cond.notify()
+
+        if to_close is not None:
+            self._close_quietly(to_close.raw)
+
+    # --- Maintenance ---
+
+    def prefill(self):
+        """Opens connections until `min_size` idle connections are available."""
+        while True:
+            with self._cond:
+                if self._closed or self._size_locked() >= self.min_size:
+                    return
+                self._in_use += 1
+            try:
+                pooled = _PooledConnection(self.connect_fn())
+            except Exception:
+                with self._cond:
+                    self._in_use -= 1
+                raise
+            with self._cond:
+                self._in_use -= 1
+                self._stats['creates'] += 1
+                self._idle.append(pooled)
+                self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._cond.notify_all()
+        for pooled in idle:
+            self._close_quietly(pooled.raw)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._in_use
+        borrows = stats['borrows']
+        stats['borrow_wait_avg'] = stats['borrow_wait_total'] / borrows if borrows else 0.0
+        stats['hit_ratio'] = stats['hits'] / borrows if borrows else 0.0
+        return stats
+
+    def log_stats(self, log=None):
+        s = self.stats()
+        (log or logger).info(
+            f"DB pool stats: borrows={s['borrows']} hits={s['hits']} creates={s['creates']} "
+            f"hit_ratio={s['hit_ratio']:.2f} wait_avg={s['borrow_wait_avg'] * 1000:.1f}ms "
+            f"wait_max={s['borrow_wait_max'] * 1000:.1f}ms idle={s['idle']} in_use={s['in_use']} "
+            f"health_failures={s['health_check_failures']} "
+            f"evicted_idle={s['evicted_idle']} evicted_lifetime={s['evicted_lifetime']}"
+        )
+
+    # --- Internals ---
+
+    def _size_locked(self):
+        return len(self._idle) + self._in_use
+
+    def _evict_expired_locked(self):
+        now = time.monotonic()
+        keep = deque()
+        for pooled in self._idle:
+            # Keep at least min_size around for idle eviction, but always honour max_lifetime
+            if pooled.age(now) >= self.max_lifetime:
+                self._stats['evicted_lifetime'] += 1
+                self._close_quietly(pooled.raw)
+            elif pooled.idle_for(now) >= self.idle_timeout and len(keep) + self._in_use >= self.min_size:
+                self._stats['evicted_idle'] += 1
+                self._close_quietly(pooled.raw)
+            else:
+                keep.append(pooled)
+        self._idle = keep
+
+    def _is_healthy(self, conn):
+        if not self.health_check_sql:
+            return True
+        try:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(self.health_check_sql)
+                cursor.fetchone()
+            finally:
+                cursor.close()
+            return True
+        except Exception as e:
+            logger.warning(f"Pooled database connection failed health check, reconnecting: {e}")
+            return False
+
+    def _checked_out(self, pooled):
+        with self._cond:
+            self._checked_out_map[id(pooled.raw)] = pooled
+
+    def _checked_in(self, conn):
+        with self._cond:
+            return self._checked_out_map.pop(id(conn), None)
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
@@ -0,0 +1,147 @@
+
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("PaythonProgram")
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+
+def _iso(timestamp):
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(timestamp)) if timestamp else None
+
+
+class SyncJob:
+    """One requested sync run and its live progress. Updated from the worker thread."""
+
+    def __init__(self, trigger):
+        self.id = uuid.uuid4().hex[:12]
+        self.trigger = trigger
+        self.status = QUEUED
+        self.stage = None
+        self.batches = 0
+        self.records_processed = 0
+        self.records_synced = 0
+        self.result = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def done(self):
+        return self.status in (SUCCEEDED, FAILED)
+
+    def report(self, stage=None, batches=0, records=0, synced=0):
+        """Progress callback for run_sync(): moves to `stage` and/or adds settled batch counts."""
+        with self._lock:
+            if stage is not None:
+                self.stage = stage
+            self.batches += batches
+            self.records_processed += records
+            self.records_synced += synced
+
+    def _start(self):
+        with self._lock:
+            self.status = RUNNING
+            self.started_at = time.time()
+
+    def _finish(self, result):
+        with self._lock:
+            self.result = result
+            self.status = SUCCEEDED if result.get('success') else FAILED
+            self.finished_at = time.time()
+
+    def as_dict(self):
+        with self._lock:
+            end = self.finished_at or time.time()
+            return {
+                'id': self.id,
+                'trigger': self.trigger,
+                'status': self.status,
+                'stage': self.stage,
+                'batches': self.batches,
+                'records_processed': self.records_processed,
+                'records_synced': self.records_synced,
+                'created_at': _iso(self.created_at),
+                'started_at': _iso(self.started_at),
+                'finished_at': _iso(self.finished_at),
+                'elapsed_seconds': round(end - self.started_at, 1) if self.started_at else 0.0,
+                'result': self.result,
+            }
+
+
+class JobManager:
+    """
+    Runs sync jobs on a small worker pool so callers (e.g. a web request) return at once.
+
+    Jobs are deduplicated by `key`: while a job for a key is queued or running, submitting
+    another one returns the in-flight job instead of starting a second, concurrent sync.
+    The most recent `history` jobs are kept for status queries.
+    """
+
+    def __init__(self, run_fn, workers=2, history=50, log=None):
+        self.run_fn = run_fn
+        self.history = history
+        self.log = log or logger
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="sync-job")
+        self._jobs = OrderedDict()
+        self._active = {}
+        self._lock = threading.Lock()
+
+    def submit(self, trigger='manual', key='sync'):
+        """Returns (job, created); created is False when an in-flight job was reused."""
+        with self._lock:
+            active = self._active.get(key)
+            if active is not None and not active.done:
+                return active, False
+            job = SyncJob(trigger)
+            self._active[key] = job
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job, key)
+        return job, True
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def recent(self, limit=10):
+        """Most recent jobs first."""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return list(reversed(jobs))[:limit]
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, job, key):
+        job._start()
+        try:
+            result = self.run_fn(job.report)
+            if not isinstance(result, dict):
+                result = {'success': False, 'message': 'Sync returned no result'}
+        except Exception as e:
+            self.log.error(f"Sync job {job.id} failed: {e}")
+            result = {'success': False, 'message': str(e)}
+        job._finish(result)
+        with self._lock:
+            if self._active.get(key) is job:
+                del self._active[key]
+
+    def _prune(self):
+        # Drop the oldest finished jobs beyond the history limit
+        excess = len(self._jobs) - self.history
+        for job_id in list(self._jobs):
+            if excess <= 0:
+                break
+            if self._jobs[job_id].done:
+                del self._jobs[job_id]
+                excess -= 1
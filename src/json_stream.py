@@ -0,0 +1,95 @@
+
+import re
+import json
+
+_SEPARATORS = re.compile(r'[\s,]*')
+_WHITESPACE = re.compile(r'\s*')
+
+
+class JsonArrayStream:
+    """
+    Incremental parser for a JSON array delivered in arbitrary text chunks.
+
+    SQL Server splits `FOR JSON` output across many ~2 KB rows, so a single element
+    can straddle two rows. Feed the chunks in order and every element that is
+    complete so far is returned; only the unfinished tail is kept in memory.
+    Output produced `WITHOUT_ARRAY_WRAPPER` (bare objects) is accepted as well.
+
+    With `raw=True` the original JSON text of each element is returned instead of
+    the parsed value, so it can be forwarded without being re-encoded.
+    """
+
+    def __init__(self, raw=False):
+        self.raw = raw
+        self._decoder = json.JSONDecoder()
+        self._buf = ''
+        self._started = False
+        self._wrapped = False
+        self._ended = False
+        self.elements = 0
+
+    def feed(self, text):
+        if text:
+            self._buf += text
+        return self._drain(final=False)
+
+    def close(self):
+        items = self._drain(final=True)
+        if self._started and not self._ended and self._wrapped:
+            raise ValueError("Incomplete JSON array: missing closing ']'.")
+        return items
+
+    def _drain(self, final):
+        items = []
+        buf = self._buf
+        pos = 0
+
+        while True:
+            if not self._started:
+                pos = _WHITESPACE.match(buf, pos).end()
+                if pos >= len(buf):
+                    break
+                self._started = True
+                self._wrapped = buf[pos] == '['
+                if self._wrapped:
+                    pos += 1
+
+            pos = _SEPARATORS.match(buf, pos).end()
+            if pos >= len(buf):
+                break
+
+            if self._ended:
+                raise ValueError(f"Unexpected data after end of JSON array at offset {pos}.")
+
+            if self._wrapped and buf[pos] == ']':
+                self._ended = True
+                pos += 1
+                continue
+
+            try:
+                value, end = self._decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if final:
+                    raise
+                break  # Element not complete yet, wait for the next chunk
+
+            # A bare scalar (number, true, null...) is only complete once a delimiter follows it
+            if not final and buf[pos] not in '{["' and (end == len(buf) or buf[end] not in ',] \t\r\n'):
+                break
+
+            items.append(buf[pos:end] if self.raw else value)
+            self.elements += 1
+            pos = end
+
+        self._buf = buf[pos:]
+        return items
+
+
+def iter_json_array(chunks, raw=False):
+    """Yields the elements of a JSON array from an iterable of text chunks."""
+    parser = JsonArrayStream(raw=raw)
+    for chunk in chunks:
+        for item in parser.feed(chunk):
+            yield item
+    for item in parser.close():
+        yield item
@@ -0,0 +1,165 @@
+
+import os
+import re
+import gzip
+import time
+import shutil
+import logging
+import threading
+from datetime import date
+
+
+class DailyRotatingFileHandler(logging.FileHandler):
+    """
+    Writes to <directory>/<prefix><YYYY-MM-DD><suffix>, e.g. Logs/Log_2024-05-01.txt.
+
+    - Switches to a new file at midnight.
+    - Within a day, once the file reaches `max_bytes`, it is renamed to
+      Log_<date>.<n>.txt and a fresh file is started.
+    - Rotated files are gzip-compressed on a background thread, and old logs are
+      pruned by age (`retention_days`) and by total size of the directory (`max_total_bytes`).
+
+    A value of 0 disables the corresponding limit.
+    """
+
+    def __init__(self, directory, prefix='Log_', suffix='.txt', max_bytes=0,
+                 retention_days=0, max_total_bytes=0, compress=True, encoding='utf-8'):
+        self.directory = directory
+        self.prefix = prefix
+        self.suffix = suffix
+        self.max_bytes = max_bytes
+        self.retention_days = retention_days
+        self.max_total_bytes = max_total_bytes
+        self.compress = compress
+        self._day = date.today()
+        self._maintenance_lock = threading.Lock()
+        self._name_pattern = re.compile(
+            rf"^{re.escape(prefix)}(\d{{4}}-\d{{2}}-\d{{2}})(?:\.(\d+))?{re.escape(suffix)}(\.gz)?$")
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        super().__init__(self._path_for(self._day), encoding=encoding)
+
+        # Tidy up files left by earlier runs
+        self._start_maintenance()
+
+    def _path_for(self, day, index=None):
+        name = f"{self.prefix}{day.isoformat()}"
+        if index is not None:
+            name += f".{index}"
+        return os.path.join(self.directory, name + self.suffix)
+
+    def should_rollover(self, record):
+        if date.today() != self._day:
+            return True
+        if not self.max_bytes or self.stream is None:
+            return False
+        # Checked before writing, so a file overshoots the cap by at most one record
+        return self.stream.tell() >= self.max_bytes
+
+    def do_rollover(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+        today = date.today()
+        if today != self._day:
+            # Previous day's file keeps its name and is compressed as is
+            self._day = today
+        elif os.path.exists(self.baseFilename):
+            os.replace(self.baseFilename, self._path_for(self._day, self._next_index()))
+
+        self.baseFilename = os.path.abspath(self._path_for(self._day))
+        self.stream = self._open()
+        self._start_maintenance()
+
+    def _next_index(self):
+        highest = 0
+        for name in os.listdir(self.directory):
+            match = self._name_pattern.match(name)
+            if match and match.group(1) == self._day.isoformat() and match.group(2):
+                highest = max(highest, int(match.group(2)))
+        return highest + 1
+
+    def emit(self, record):
+        try:
+            if self.should_rollover(record):
+                self.do_rollover()
+        except Exception:
+            self.handleError(record)
+            return
+        super().emit(record)
+
+    # --- Background maintenance ---
+
+    def _start_maintenance(self):
+        threading.Thread(target=self._maintain, name="log-maintenance", daemon=True).start()
+
+    def _log_files(self):
+        """[(path, mtime, size)] of this handler's log files, excluding the active one."""
+        active = os.path.abspath(self.baseFilename)
+        files = []
+        for name in os.listdir(self.directory):
+            if not self._name_pattern.match(name):
+                continue
+            path = os.path.abspath(os.path.join(self.directory, name))
+            if path == active:
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((path, stat.st_mtime, stat.st_size))
+        return files
+
+    def _maintain(self):
+        with self._maintenance_lock:
+            try:
+                if self.compress:
+                    for path, _, _ in self._log_files():
+                        if not path.endswith('.gz'):
+                            _gzip_file(path)
+                self._prune()
+            except Exception as e:
+                # Never let housekeeping take logging down
+                logging.getLogger("PaythonProgram").warning(f"Log maintenance failed: {e}")
+
+    def _prune(self):
+        files = sorted(self._log_files(), key=lambda f: f[1])
+        if self.retention_days:
+            cutoff = time.time() - self.retention_days * 86400
+            expired = [f for f in files if f[1] < cutoff]
+            for path, _, _ in expired:
+                _remove(path)
+            files = [f for f in files if f[1] >= cutoff]
+
+        if self.max_total_bytes:
+            try:
+                active_size = os.path.getsize(self.baseFilename)
+            except OSError:
+                active_size = 0
+            total = active_size + sum(f[2] for f in files)
+            for path, _, size in files:
+                if total <= self.max_total_bytes:
+                    break
+                _remove(path)
+                total -= size
+
+
+def _gzip_file(path):
+    target = path + '.gz'
+    tmp_target = target + '.tmp'
+    with open(path, 'rb') as src, gzip.open(tmp_target, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    mtime = os.path.getmtime(path)
+    os.replace(tmp_target, target)
+    # Keep the original timestamp so age-based pruning still works
+    os.utime(target, (mtime, mtime))
+    os.remove(path)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
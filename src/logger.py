@@ -1,46 +1,244 @@
-
 import logging
+import logging.handlers
 import os
 import sys
-from datetime import datetime
+import queue
+import atexit
+import threading
+
+from config import settings
+
+try:
+    from src.log_rotation import DailyRotatingFileHandler
+except ImportError:
+    # Fallback for frozen executable where src might be flattened
+    from log_rotation import DailyRotatingFileHandler
+
+# Loggers used across the application; both feed the same pipeline
+LOGGER_NAMES = ("TanhkapayPythonProgram", "PaythonProgram")
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Errors wait this long for room in a full queue before they are dropped too
+_PRIORITY_PUT_TIMEOUT = 1.0
+
+_warned_log_path = False
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Enqueues records without blocking the logging thread. When the queue is full,
+    records below ERROR are dropped immediately and errors wait briefly for room.
+    Dropped records are counted per level so the listener can report them.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self._lock = threading.Lock()
+        self.dropped_total = 0
+        self._dropped_pending = {}
+
+    def enqueue(self, record):
+        try:
+            if record.levelno >= logging.ERROR:
+                self.queue.put(record, timeout=_PRIORITY_PUT_TIMEOUT)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped_total += 1
+                self._dropped_pending[record.levelname] = self._dropped_pending.get(record.levelname, 0) + 1
+
+    def take_dropped(self):
+        """Returns and resets the {level: count} of records dropped since the last call."""
+        with self._lock:
+            dropped, self._dropped_pending = self._dropped_pending, {}
+        return dropped
+
+
+class FanOutHandler(logging.Handler):
+    """Runs on the listener thread and hands each record to every registered sink."""
+
+    def __init__(self, source):
+        super().__init__()
+        self.source = source
+        self._sinks = []
+        self._sinks_lock = threading.Lock()
+
+    @property
+    def sinks(self):
+        with self._sinks_lock:
+            return list(self._sinks)
+
+    def add_sink(self, handler):
+        with self._sinks_lock:
+            if handler not in self._sinks:
+                self._sinks.append(handler)
+
+    def remove_sink(self, handler):
+        with self._sinks_lock:
+            if handler in self._sinks:
+                self._sinks.remove(handler)
+
+    def _dispatch(self, record):
+        for sink in self.sinks:
+            if record.levelno >= sink.level:
+                sink.handle(record)
+
+    def handle(self, record):
+        self._dispatch(record)
+        dropped = self.source.take_dropped()
+        if dropped:
+            counts = ", ".join(f"{count} {level}" for level, count in sorted(dropped.items()))
+            self._dispatch(logging.makeLogRecord({
+                'name': record.name,
+                'levelno': logging.WARNING,
+                'levelname': 'WARNING',
+                'msg': f"Logging backlog: dropped {sum(dropped.values())} log records ({counts}).",
+            }))
+        return True
+
+    def flush(self):
+        for sink in self.sinks:
+            sink.flush()
+
+
+class _LogListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # Wait for room rather than failing when the queue is full at shutdown
+        self.queue.put(self._sentinel, timeout=5)
+
+
+class LogPipeline:
+    """
+    Bounded queue + one background listener. Loggers only enqueue; the listener
+    writes to the file, console and UI sinks.
+    """
+
+    def __init__(self, maxsize):
+        self.queue = queue.Queue(maxsize=max(1, maxsize))
+        self.queue_handler = DroppingQueueHandler(self.queue)
+        self.fan_out = FanOutHandler(self.queue_handler)
+        self.listener = _LogListener(self.queue, self.fan_out)
+        self.listener.start()
+
+    def attach(self, logger):
+        if self.queue_handler not in logger.handlers:
+            logger.addHandler(self.queue_handler)
+        # The sinks already get every record; handlers on the root logger (e.g. basicConfig
+        # in the Qt UI) would otherwise write each one a second time on the calling thread
+        logger.propagate = False
+
+    def stop(self):
+        for name in LOGGER_NAMES:
+            logger = logging.getLogger(name)
+            logger.removeHandler(self.queue_handler)
+            logger.propagate = True
+        try:
+            self.listener.stop()
+        except queue.Full:
+            pass
+        self.fan_out.flush()
+
+
+def get_pipeline():
+    """Returns the process-wide logging pipeline, starting it and attaching the app loggers on first use."""
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = LogPipeline(settings.get_log_queue_size())
+            level = getattr(logging, settings.get_log_level().upper(), logging.INFO)
+            for name in LOGGER_NAMES:
+                logger = logging.getLogger(name)
+                if logger.level == logging.NOTSET:
+                    logger.setLevel(level)
+                _pipeline.attach(logger)
+            atexit.register(shutdown_logging)
+        return _pipeline
+
+
+def shutdown_logging():
+    """Flushes queued records to the sinks and stops the listener."""
+    global _pipeline
+    with _pipeline_lock:
+        pipeline, _pipeline = _pipeline, None
+    if pipeline is not None:
+        pipeline.stop()
+
+
+def add_log_sink(handler):
+    """Registers a handler (file, console, UI) that receives every application log record."""
+    get_pipeline().fan_out.add_sink(handler)
+    return handler
+
+
+def remove_log_sink(handler):
+    get_pipeline().fan_out.remove_sink(handler)
+
+
+def get_dropped_log_count():
+    """Total log records dropped because the queue was full."""
+    return get_pipeline().queue_handler.dropped_total
+
 
 def setup_logger():
-    # Load settings (assuming env vars are loaded)
-    log_path = os.getenv('LOG_PATH', './Logs/')
-    log_level_str = os.getenv('LOG_LEVEL', 'INFO')
-    
+    # Settings snapshot (env vars are loaded by settings.load())
+    cfg = settings.get_settings()
+    log_path = cfg.log_path
+    log_level_str = cfg.log_level
+
     # Ensure log directory exists
     if not os.path.exists(log_path):
         os.makedirs(log_path)
-    
+
     # Create a custom logger
     logger = logging.getLogger("TanhkapayPythonProgram")
-    
+
     # Set level
     level = getattr(logging, log_level_str.upper(), logging.INFO)
-    logger.setLevel(level)
+    for name in LOGGER_NAMES:
+        logging.getLogger(name).setLevel(level)
 
     # Check if file logging is enabled
-    log_to_file = os.getenv('LOG_TO_FILE', 'True').lower() in ('true', '1', 'yes')
+    log_to_file = cfg.log_to_file
+
+    # Add sinks (check if they exist to avoid duplicates)
+    pipeline = get_pipeline()
+    sinks = pipeline.fan_out.sinks
+    has_file_handler = any(h.get_name() == 'log-file' for h in sinks)
+    has_stream_handler = any(h.get_name() == 'console' for h in sinks)
 
-    # Add handlers (check if they exist to avoid duplicates)
-    has_file_handler = any(isinstance(h, logging.FileHandler) for h in logger.handlers)
-    has_stream_handler = any(isinstance(h, logging.StreamHandler) and not isinstance(h, logging.FileHandler) for h in logger.handlers)
-    
-    log_format = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    log_format = logging.Formatter(LOG_FORMAT)
 
     if log_to_file and not has_file_handler:
-        log_filename = f"Log_{datetime.now().strftime('%Y-%m-%d')}.txt"
-        file_handler = logging.FileHandler(os.path.join(log_path, log_filename))
+        # Log_<date>.txt, rolled over at midnight and at LOG_MAX_BYTES
+        file_handler = DailyRotatingFileHandler(
+            log_path,
+            max_bytes=cfg.log_max_bytes,
+            retention_days=cfg.log_retention_days,
+            max_total_bytes=cfg.log_max_total_mb * 1024 * 1024,
+            compress=cfg.log_compress,
+        )
         file_handler.setFormatter(log_format)
-        logger.addHandler(file_handler)
-    
-    # Note: If LOG_TO_FILE is False, we don't remove existing file handlers here, 
+        file_handler.set_name('log-file')
+        pipeline.fan_out.add_sink(file_handler)
+
+    # Note: If LOG_TO_FILE is False, we don't remove existing file handlers here,
     # but normally this runs once or we assume the restart handles it.
-    
+
     if not has_stream_handler:
         console_handler = logging.StreamHandler(sys.stdout)
         console_handler.setFormatter(log_format)
-        logger.addHandler(console_handler)
+        console_handler.set_name('console')
+        pipeline.fan_out.add_sink(console_handler)
+
+    global _warned_log_path
+    configured = os.environ.get('LOG_PATH', '')
+    if not _warned_log_path and settings.is_foreign_path(configured):
+        logger.warning(f"LOG_PATH '{configured}' is not a path on this system. Writing logs to {log_path}")
+        _warned_log_path = True
 
     return logger
@@ -1,7 +1,8 @@
 
 import os
 import sys
-from dotenv import load_dotenv
+import argparse
+from functools import partial
 
 # Add the project root to the python path
 if getattr(sys, 'frozen', False):
@@ -15,15 +16,29 @@ else:
 try:
     from config import settings
     from src.logger import setup_logger
-    from src.database import get_bio_punches_data, update_sync_status
-    from src.api_client import send_punch_data
+    from src.database import iter_bio_punches_records, update_sync_status, log_pool_stats, close_pool
+    from src.api_client import send_punch_data, close_session, reset_circuit_breaker
+    from src.batching import iter_batches
+    from src.pipeline import SyncPipeline
+    from src.outbox import get_outbox, iter_sync_batches
+    from src.watermark import get_watermark, WatermarkCycle
+    from src.daemon import SyncDaemon
+    from src.timings import SyncTimings
+    from src import metrics
 except ImportError:
     # Fallback for frozen executable where src might be flattened or not a package
     # This assumes PyInstaller bundles contents of src at root or similar
     from config import settings
     from logger import setup_logger
-    from database import get_bio_punches_data, update_sync_status
-    from api_client import send_punch_data
+    from database import iter_bio_punches_records, update_sync_status, log_pool_stats, close_pool
+    from api_client import send_punch_data, close_session, reset_circuit_breaker
+    from batching import iter_batches
+    from pipeline import SyncPipeline
+    from outbox import get_outbox, iter_sync_batches
+    from watermark import get_watermark, WatermarkCycle
+    from daemon import SyncDaemon
+    from timings import SyncTimings
+    import metrics
 
 def get_application_path():
     """
@@ -38,61 +53,256 @@ def get_application_path():
         # Running as python script
         return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
-def run_sync():
+def load_config(reload=False):
     """
-    Runs the synchronization process and returns a result dictionary.
-    Returns:
-        dict: {'success': bool, 'message': str}
+    Loads config/.env into the settings snapshot and sets up logging. Returns the logger.
+    The file is only re-read when it changed on disk; reload=True forces a re-read.
+    Either way variables from the process environment keep precedence over the file.
     """
     # Determine base path
     base_path = get_application_path()
     
     # Load configuration
     env_path = os.path.join(base_path, 'config', '.env')
-    load_dotenv(env_path)
+    if reload:
+        settings.reload(env_path, override=False)
+    else:
+        settings.load(env_path)
     
     # Setup logging
-    logger = setup_logger()
+    return setup_logger()
+
+def prepare_sync():
+    """
+    Loads configuration and logging for a sync cycle. Returns the logger.
+    """
+    logger = load_config()
     logger.info("Starting TanhkapayPythonProgram Data Sync...")
+    return logger
+
+def build_sync_result(summary, logger):
+    """
+    Turns a pipeline summary into the {'success', 'message'} result returned to callers.
+    """
+    total_batches = summary['total_batches']
+    failed_batches = summary['failed_batches']
+    synced_count = summary['synced_count']
+    last_error = summary['last_error']
+
+    if total_batches == 0:
+        logger.info("No record found for syncing.")
+        return {'success': True, 'message': "No record found for syncing."}
+
+    reader_failed = summary.get('reader_failed', False)
+
+    if failed_batches or reader_failed:
+        error_msg = (f"Synced {synced_count} records; {failed_batches} of {total_batches} batches failed"
+                     + ("; reading punch data stopped early" if reader_failed else "")
+                     + f". Last error: {last_error}")
+        logger.error(error_msg)
+        return {'success': False, 'message': error_msg}
+
+    logger.info("Database updated successfully.")
+    return {'success': True, 'message': f"Successfully synced {synced_count} records."}
+
+class BatchSource:
+    """
+    The upload batches of one sync cycle plus the local state (outbox, watermark)
+    that has to be updated as each batch settles.
+    """
+
+    def __init__(self, batches, outbox=None, cycle=None):
+        self.batches = batches
+        self.outbox = outbox
+        self.cycle = cycle
+
+    def uploaded(self, batch, result):
+        """Called as soon as a batch's upload returns, before it is acknowledged."""
+        if self.outbox is not None:
+            self.outbox.note_upload(batch, bool(result and result.get('answered')))
+
+    def upload_fn(self, upload_fn):
+        """Wraps `upload_fn(batch)` so that uploaded() sees every result, even an exception."""
+        def upload(batch):
+            result = None
+            try:
+                result = upload_fn(batch)
+                return result
+            finally:
+                self.uploaded(batch, result)
+        return upload
+
+    def settle(self, batch, saved_txn_ids):
+        if self.outbox is not None:
+            self.outbox.settle(batch, saved_txn_ids)
+        if self.cycle is not None:
+            self.cycle.observe(batch, saved_txn_ids)
+
+    def finish(self, logger):
+        if self.cycle is not None:
+            try:
+                self.cycle.commit()
+            except Exception as e:
+                logger.error(f"Saving the watermark failed: {e}")
+        if self.outbox is None:
+            return
+        try:
+            removed = self.outbox.compact()
+            depth = self.outbox.depth()
+            metrics.OUTBOX_DEPTH.replace(depth)
+            logger.info(f"Outbox compacted ({removed} acknowledged records removed). Remaining: {depth or 'empty'}")
+        except Exception as e:
+            logger.error(f"Outbox maintenance failed: {e}")
+
+def open_batch_source(logger, timings=None):
+    """
+    Returns the BatchSource for a sync cycle. With the outbox enabled, batches are
+    persisted locally before upload and pending ones are drained first; otherwise
+    they are streamed straight from the database. With INCREMENTAL_FETCH on, only
+    punches beyond the watermark are read, apart from periodic full sweeps.
+    """
+    max_records = settings.get_upload_batch_max_records()
+    max_bytes = settings.get_upload_batch_max_bytes()
 
     try:
-        # 1. Fetch data from DB
-        logger.info("Fetching data from database...")
-        data = get_bio_punches_data()
-        
-        if not data:
-            logger.info("No record found for syncing.")
-            return {'success': True, 'message': "No record found for syncing."}
-
-        # 2. Sync with API
-        logger.info("Syncing data with API...")
-        api_result = send_punch_data(data)
-        
-        if api_result and api_result.get('success'):
-             txn_ids = api_result.get('txn_ids')
-             if txn_ids:
-                 # 3. Update DB status
-                 logger.info(f"Records Sync Successfully. Updating status for txn ids: {txn_ids}")
-                 update_result = update_sync_status(txn_ids)
-                 if update_result:
-                     logger.info("Database updated successfully.")
-                     return {'success': True, 'message': f"Successfully synced {len(txn_ids)} records."}
-                 else:
-                     logger.warning("Records synced but failed to update database status.")
-                     return {'success': False, 'message': "Records synced but failed to update database status."}
-             else:
-                 logger.warning("API returned success but no transaction IDs.")
-                 return {'success': True, 'message': "API returned success but no transaction IDs."}
+        outbox = get_outbox()
+    except Exception as e:
+        # A sync without the outbox beats no sync at all
+        logger.error(f"Could not open the outbox at {settings.get_outbox_path()}: {e}. "
+                     f"Syncing straight from the database this cycle.")
+        outbox = None
+    cycle = None
+    fetch_records = lambda: iter_bio_punches_records(raw=True, timings=timings)
+
+    watermark = get_watermark()
+    if watermark is not None:
+        cycle = WatermarkCycle(
+            watermark,
+            lambda after: iter_bio_punches_records(raw=True, after=after, timings=timings),
+            durable_retries=outbox is not None,
+            log=logger,
+        )
+        fetch_records = cycle.fetch_records
+
+    if outbox is not None:
+        # Resuming after a drain only needs punches beyond what the outbox already holds
+        fetch_after = lambda after: iter_bio_punches_records(raw=True, after=after, timings=timings)
+        batches = iter_sync_batches(outbox, fetch_records, max_records, max_bytes, log=logger,
+                                    fetch_after=fetch_after)
+    else:
+        batches = iter_batches(fetch_records(), max_records=max_records, max_bytes=max_bytes)
+    return BatchSource(batches, outbox, cycle)
+
+def _no_progress(**kwargs):
+    pass
+
+def run_sync(logger=None, timings=None, progress=None):
+    """
+    Runs the synchronization process and returns a result dictionary.
+    Pass `logger` when configuration is already loaded (daemon mode) to skip reloading it.
+    Pass a SyncTimings as `timings` to collect the measurements yourself.
+    `progress` is called with stage=<name> as the cycle moves on ('starting', 'syncing',
+    'finishing') and with batches=/records=/synced= increments as each batch settles.
+    Returns:
+        dict: {'success': bool, 'message': str, 'timings': dict}
+    """
+    timings = timings or SyncTimings()
+    progress = progress or _no_progress
+    progress(stage='starting')
+    with timings.stage('config_load'):
+        if logger is None:
+            logger = prepare_sync()
         else:
-             error_msg = f"API Sync failed. Message: {api_result.get('message') if api_result else 'Unknown error'}"
-             logger.error(error_msg)
-             return {'success': False, 'message': error_msg}
+            logger.info("Starting TanhkapayPythonProgram Data Sync...")
+    source = None
+
+    try:
+        # 1. Stream records from DB (or the local outbox), grouped into bounded batches
+        logger.info("Fetching data from database...")
+        source = open_batch_source(logger, timings)
+
+        def settled(batch, saved_txn_ids):
+            source.settle(batch, saved_txn_ids)
+            progress(batches=1, records=len(batch), synced=len(saved_txn_ids or ()))
+
+        progress(stage='syncing')
+
+        # 2. Upload and 3. acknowledge each batch, overlapping with the DB read
+        pipeline = SyncPipeline(
+            source.batches,
+            upload_fn=source.upload_fn(partial(send_punch_data, timings=timings)),
+            ack_fn=partial(update_sync_status, timings=timings),
+            queue_size=settings.get_pipeline_queue_size(),
+            upload_workers=settings.get_upload_workers(),
+            consolidate_acks=settings.get_ack_mode() == 'consolidated',
+            on_settled=settled,
+            log=logger,
+        )
+        summary = pipeline.run()
+        timings.count('batches', summary['total_batches'])
+        timings.count('synced_records', summary['synced_count'])
+        result = build_sync_result(summary, logger)
 
     except Exception as e:
         logger.exception(f"An unexpected error occurred: {e}")
-        return {'success': False, 'message': f"An unexpected error occurred: {e}"}
+        result = {'success': False, 'message': f"An unexpected error occurred: {e}"}
+    finally:
+        progress(stage='finishing')
+        if source is not None:
+            source.finish(logger)
+        log_pool_stats(logger)
+        timings.finish()
+        logger.info(timings.log_line())
+
+    metrics.record_sync(result, timings)
+    result['timings'] = timings.as_dict()
+    return result
+
+def shutdown():
+    """Closes the pooled DB connections and the HTTP session."""
+    close_pool()
+    close_session()
+
+def reload_config():
+    """SIGHUP handler for daemon mode: re-reads config/.env and drops the old circuit breaker."""
+    logger = load_config(reload=True)
+    reset_circuit_breaker()
+    return logger
+
+def run_daemon():
+    """
+    Long-running mode for the systemd service: keeps the DB pool and HTTP session warm
+    and runs a sync every SYNC_INTERVAL minutes. Each cycle picks up a changed config/.env;
+    SIGHUP re-reads it at once and starts over with a fresh circuit breaker.
+    """
+    logger = load_config()
+    if settings.get_metrics_port():
+        try:
+            metrics.start_metrics_server(settings.get_metrics_port(), settings.get_metrics_host())
+            logger.info(f"Serving metrics at http://{settings.get_metrics_host()}:{settings.get_metrics_port()}/metrics")
+        except OSError as e:
+            logger.error(f"Could not start the metrics listener on port {settings.get_metrics_port()}: {e}")
+    daemon = SyncDaemon(
+        run_fn=lambda: run_sync(load_config()),
+        reload_fn=reload_config,
+        interval_fn=lambda: max(1, settings.get_sync_interval()),
+        shutdown_fn=shutdown,
+        stop_timeout=settings.get_daemon_stop_timeout(),
+        cycle_timeout_fn=lambda: settings.get_daemon_cycle_timeout() or 2 * max(1, settings.get_sync_interval()) * 60,
+        log=logger,
+    )
+    daemon.run()
 
 def main():
+    parser = argparse.ArgumentParser(description="Tanhkapay biometric punch sync")
+    parser.add_argument('--daemon', action='store_true',
+                        help="keep running and sync every SYNC_INTERVAL minutes (systemd service mode)")
+    args = parser.parse_args()
+
+    if args.daemon:
+        run_daemon()
+        return
+
     result = run_sync()
     print(result['message'])
 
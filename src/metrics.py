@@ -0,0 +1,233 @@
+
+import math
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Default latency buckets in seconds (Prometheus client defaults plus a few longer ones
+# for whole sync cycles)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        if not self.labelnames:
+            # Unlabelled series are exported as 0 before the first update
+            self._values[()] = self._initial()
+
+    def _initial(self):
+        return 0
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    """Monotonically increasing total."""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, e.g. the outbox depth."""
+
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def replace(self, values_by_label):
+        """Sets the gauge to exactly {label value: value} for a single-label gauge, dropping stale series."""
+        with self._lock:
+            self._values = {(str(label),): value for label, value in values_by_label.items()}
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, with their sum and count."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        super().__init__(name, documentation, labelnames)
+
+    def _initial(self):
+        return {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = self._initial()
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][i] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    def _render_sample(self, key, state):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, state['counts']):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, [('le', _format_value(float(bound)))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(state['sum'])}")
+        lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+
+class Registry:
+    """Holds the process's metrics and renders them in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+SYNC_RUNS = REGISTRY.counter(
+    'paython_sync_runs_total', 'Sync cycles by outcome (success, failure, empty).', ['outcome'])
+SYNC_DURATION = REGISTRY.histogram(
+    'paython_sync_duration_seconds', 'Wall-clock duration of whole sync cycles.')
+SYNC_STAGE_SECONDS = REGISTRY.histogram(
+    'paython_sync_stage_seconds', 'Time spent per sync stage in each cycle, summed across upload workers.', ['stage'])
+LAST_SYNC_TIMESTAMP = REGISTRY.gauge(
+    'paython_last_sync_timestamp_seconds', 'Unix time a sync cycle last finished, by outcome.', ['outcome'])
+DB_BYTES_FETCHED = REGISTRY.counter(
+    'paython_db_bytes_fetched_total', 'Bytes of punch JSON read from the database.')
+RECORDS_SYNCED = REGISTRY.counter(
+    'paython_records_synced_total', 'Punch records the API confirmed as saved.')
+IDS_ACKNOWLEDGED = REGISTRY.counter(
+    'paython_db_acknowledged_ids_total', 'Transaction ids marked as synced in the database.')
+BYTES_SENT = REGISTRY.counter(
+    'paython_api_bytes_sent_total', 'Request body bytes sent to the API, after compression.')
+API_RESPONSES = REGISTRY.counter(
+    'paython_api_responses_total', 'API responses by HTTP status code ("error" for transport failures).', ['code'])
+API_RETRIES = REGISTRY.counter(
+    'paython_api_retries_total', 'Upload attempts retried after a failed request.')
+OUTBOX_DEPTH = REGISTRY.gauge(
+    'paython_outbox_records', 'Records held in the local outbox, by state.', ['state'])
+SCHEDULER_LAG = REGISTRY.histogram(
+    'paython_scheduler_lag_seconds', 'How late scheduled sync cycles started relative to their due time.')
+
+
+def record_sync(result, timings):
+    """Feeds the outcome and SyncTimings of a finished sync cycle into the cycle-level metrics."""
+    if result.get('success'):
+        outcome = 'empty' if not timings.counts.get('batches') else 'success'
+    else:
+        outcome = 'failure'
+    SYNC_RUNS.inc(outcome=outcome)
+    SYNC_DURATION.observe(timings.total)
+    for stage, seconds in timings.stages.items():
+        SYNC_STAGE_SECONDS.observe(seconds, stage=stage)
+    RECORDS_SYNCED.inc(timings.counts.get('synced_records', 0))
+    LAST_SYNC_TIMESTAMP.set(time.time(), outcome=outcome)
+
+
+def render_metrics():
+    return REGISTRY.render()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render_metrics().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would flood the application log
+        pass
+
+
+def start_metrics_server(port, host='127.0.0.1'):
+    """Serves /metrics on a background thread (for daemon mode, which has no web UI). Returns the server."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
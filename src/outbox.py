@@ -0,0 +1,437 @@
+
+import os
+import json
+import time
+import uuid
+import hashlib
+import sqlite3
+import logging
+import argparse
+import threading
+from itertools import islice
+
+from config import settings
+
+try:
+    from src.batching import iter_batches
+except ImportError:
+    # Fallback for frozen executable where src might be flattened
+    from batching import iter_batches
+
+logger = logging.getLogger("PaythonProgram")
+
+PENDING = 'pending'
+IN_FLIGHT = 'in_flight'
+ACKED = 'acked'
+# Answered by the API OUTBOX_MAX_ATTEMPTS times without being saved; no longer sent
+PARKED = 'parked'
+
+# SQLite limits the number of bound parameters per statement
+_PARAM_CHUNK = 500
+
+_outbox = None
+_outbox_lock = threading.Lock()
+
+
+class Outbox:
+    """
+    Durable local store of fetched punches, kept in a SQLite database in WAL mode.
+
+    Records fetched from SQL Server are written here before upload and move through
+    pending -> in_flight -> acked. If the API is down, the records stay pending and the
+    next cycle re-sends them from local storage without querying SQL Server. A record
+    that the API keeps answering without saving is parked after OUTBOX_MAX_ATTEMPTS
+    tries so it cannot hold up the rest. Acked rows are removed by compact().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                txn_key TEXT UNIQUE,
+                payload BLOB NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                batch_id TEXT,
+                updated_at REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                payload_hash TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_outbox_state ON outbox (state, id);
+            CREATE INDEX IF NOT EXISTS idx_outbox_batch ON outbox (batch_id);
+            CREATE TABLE IF NOT EXISTS outbox_meta (
+                name TEXT PRIMARY KEY,
+                value INTEGER
+            );
+        """)
+        self._migrate()
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_hash ON outbox (payload_hash)")
+
+        # Batches handed out by the current drain that the API has not answered yet
+        self._drain_cond = threading.Condition()
+        self._drain_open = set()
+        self._drain_answered = False
+
+        # Anything left in flight by a crash or shutdown is retried
+        with self._lock:
+            recovered = self._conn.execute(
+                "UPDATE outbox SET state = ?, batch_id = NULL WHERE state = ?", (PENDING, IN_FLIGHT)).rowcount
+        if recovered:
+            logger.info(f"Outbox: returned {recovered} in-flight records to pending after restart.")
+
+    def _migrate(self):
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(outbox)")}
+        if 'attempts' not in columns:
+            # Outbox created before attempts were counted
+            self._conn.execute("ALTER TABLE outbox ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+        if 'payload_hash' not in columns:
+            self._conn.execute("ALTER TABLE outbox ADD COLUMN payload_hash TEXT")
+            for row_id, payload in self._conn.execute(
+                    "SELECT id, payload FROM outbox WHERE txn_key IS NULL").fetchall():
+                self._conn.execute("UPDATE outbox SET payload_hash = ? WHERE id = ?",
+                                   (_payload_hash(payload), row_id))
+        # Seed the highest stored key from the rows an older outbox still holds
+        self._conn.execute(
+            "INSERT OR IGNORE INTO outbox_meta (name, value) "
+            "SELECT 'high_key', MAX(CAST(txn_key AS INTEGER)) FROM outbox "
+            "WHERE txn_key GLOB '[0-9]*' AND txn_key NOT GLOB '*[^0-9]*' "
+            "HAVING MAX(CAST(txn_key AS INTEGER)) IS NOT NULL")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # --- Queries ---
+
+    def count(self, state=PENDING):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM outbox WHERE state = ?", (state,)).fetchone()[0]
+
+    def depth(self):
+        """Returns {state: count} for every state present."""
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM outbox GROUP BY state").fetchall()
+        return dict(rows)
+
+    def high_key(self):
+        """Highest numeric transaction key ever stored, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM outbox_meta WHERE name = 'high_key'").fetchone()
+        return row[0] if row else None
+
+    def skip_stored(self, records):
+        """
+        Filters (txn_key, text) records down to those the outbox does not hold yet, so a
+        record that is pending, in flight or parked is not stored twice. Records without
+        a transaction key are matched on their text.
+        """
+        records = iter(records)
+        while True:
+            chunk = list(islice(records, _PARAM_CHUNK))
+            if not chunk:
+                return
+            keys = [key for key, _ in chunk if key is not None]
+            hashes = [_payload_hash(text) for key, text in chunk if key is None]
+            stored = set()
+            with self._lock:
+                if keys:
+                    stored.update(row[0] for row in self._conn.execute(
+                        f"SELECT txn_key FROM outbox WHERE txn_key IN ({','.join('?' * len(keys))})", keys))
+                if hashes:
+                    stored.update(row[0] for row in self._conn.execute(
+                        f"SELECT payload_hash FROM outbox WHERE payload_hash IN ({','.join('?' * len(hashes))})",
+                        hashes))
+            for key, text in chunk:
+                if (key if key is not None else _payload_hash(text)) not in stored:
+                    yield key, text
+
+    # --- Drain tracking ---
+
+    def note_upload(self, batch, answered):
+        """Records that the upload of a drained batch finished; `answered` if the API replied."""
+        with self._drain_cond:
+            if batch.outbox_batch_id in self._drain_open:
+                self._drain_open.discard(batch.outbox_batch_id)
+                self._drain_answered = self._drain_answered or answered
+                self._drain_cond.notify_all()
+
+    def wait_for_drain(self, timeout=None):
+        """
+        Blocks until the API answered one of the drained batches or all of them failed as a
+        whole. Returns True if the API answered (it is reachable).
+        """
+        with self._drain_cond:
+            self._drain_cond.wait_for(lambda: self._drain_answered or not self._drain_open, timeout)
+            return self._drain_answered
+
+    # --- Writes ---
+
+    def store_batch(self, batch):
+        """
+        Persists a freshly fetched batch (batch.keys hold the transaction keys) and marks
+        it in flight under a new outbox batch id.
+        """
+        batch_id = uuid.uuid4().hex
+        now = time.time()
+        rows = [(key, part, IN_FLIGHT, batch_id, now, None if key is not None else _payload_hash(part))
+                for key, part in zip(batch.keys, batch.parts)]
+        numeric = [int(key) for key in batch.keys if key is not None and key.isdigit()]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO outbox (txn_key, payload, state, batch_id, updated_at, payload_hash) "
+                    "VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(txn_key) DO UPDATE SET payload = excluded.payload, state = excluded.state, "
+                    "batch_id = excluded.batch_id, updated_at = excluded.updated_at",
+                    rows)
+                if numeric:
+                    self._conn.execute(
+                        "INSERT INTO outbox_meta (name, value) VALUES ('high_key', ?) "
+                        "ON CONFLICT(name) DO UPDATE SET value = MAX(value, excluded.value)",
+                        (max(numeric),))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        batch.outbox_batch_id = batch_id
+        return batch
+
+    def claim_pending_batches(self, max_records, max_bytes):
+        """
+        Yields pending records as upload batches, marking each batch in flight as it is
+        handed out. batch.keys hold outbox row ids.
+        """
+        with self._drain_cond:
+            self._drain_open.clear()
+            self._drain_answered = False
+
+        def pending_rows():
+            last_id = 0
+            while True:
+                with self._lock:
+                    rows = self._conn.execute(
+                        "SELECT id, payload FROM outbox WHERE state = ? AND id > ? ORDER BY id LIMIT ?",
+                        (PENDING, last_id, max_records)).fetchall()
+                if not rows:
+                    return
+                for row_id, payload in rows:
+                    yield row_id, bytes(payload)
+                last_id = rows[-1][0]
+
+        for batch in iter_batches(pending_rows(), max_records=max_records, max_bytes=max_bytes, keyed=True):
+            batch_id = uuid.uuid4().hex
+            now = time.time()
+            with self._lock:
+                self._conn.execute("BEGIN")
+                try:
+                    for chunk in _chunks(batch.keys, _PARAM_CHUNK):
+                        self._conn.execute(
+                            f"UPDATE outbox SET state = ?, batch_id = ?, updated_at = ? "
+                            f"WHERE id IN ({','.join('?' * len(chunk))})",
+                            [IN_FLIGHT, batch_id, now] + list(chunk))
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+            batch.outbox_batch_id = batch_id
+            with self._drain_cond:
+                self._drain_open.add(batch_id)
+            yield batch
+
+    def settle(self, batch, saved_txn_ids):
+        """
+        Records the outcome of a batch. Rows whose transaction id was saved by the API
+        (and acknowledged in SQL Server) become acked; everything else returns to pending.
+        Pass saved_txn_ids=None when the upload or acknowledgement failed.
+
+        When the API answered but did not save a record, that counts as an attempt; the
+        record is parked once it reaches OUTBOX_MAX_ATTEMPTS. Failures of the batch as a
+        whole (API down, acknowledgement failed) are not counted.
+        """
+        batch_id = batch.outbox_batch_id
+        if batch_id is None:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                if saved_txn_ids is not None:
+                    matched = 0
+                    for chunk in _chunks([str(t) for t in saved_txn_ids], _PARAM_CHUNK):
+                        matched += self._conn.execute(
+                            f"UPDATE outbox SET state = ?, updated_at = ? WHERE batch_id = ? "
+                            f"AND txn_key IN ({','.join('?' * len(chunk))})",
+                            [ACKED, now, batch_id] + list(chunk)).rowcount
+                    if saved_txn_ids:
+                        if matched == 0:
+                            # Ids don't correspond to PUNCH_ID_FIELD; settle the batch as a whole
+                            # rather than retrying records that the API has already saved
+                            logger.warning(f"Outbox: none of the saved transaction ids matched field "
+                                           f"'{settings.get_punch_id_field()}'. Check PUNCH_ID_FIELD.")
+                            where = "batch_id = ?"
+                        else:
+                            # Records without a recognisable id can only be settled with the batch as a whole
+                            where = "batch_id = ? AND txn_key IS NULL"
+                        self._conn.execute(
+                            f"UPDATE outbox SET state = ?, updated_at = ? WHERE {where}",
+                            (ACKED, now, batch_id))
+                parked = 0
+                if saved_txn_ids is not None:
+                    max_attempts = settings.get_outbox_max_attempts()
+                    if max_attempts:
+                        parked = self._conn.execute(
+                            "UPDATE outbox SET state = ?, attempts = attempts + 1, batch_id = NULL, updated_at = ? "
+                            "WHERE batch_id = ? AND state = ? AND attempts + 1 >= ?",
+                            (PARKED, now, batch_id, IN_FLIGHT, max_attempts)).rowcount
+                    attempt = 1
+                else:
+                    attempt = 0
+                self._conn.execute(
+                    "UPDATE outbox SET state = ?, attempts = attempts + ?, batch_id = NULL, updated_at = ? "
+                    "WHERE batch_id = ? AND state = ?",
+                    (PENDING, attempt, now, batch_id, IN_FLIGHT))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        # A batch settled without an upload result (e.g. the upload raised) counts as unanswered
+        with self._drain_cond:
+            if batch_id in self._drain_open:
+                self._drain_open.discard(batch_id)
+                self._drain_cond.notify_all()
+        if parked:
+            logger.warning(f"Outbox: parked {parked} records that the API did not save in "
+                           f"{settings.get_outbox_max_attempts()} attempts. They will not be sent again "
+                           f"until requeued.")
+
+    def requeue_parked(self):
+        """Returns parked records to pending with a fresh attempt count. Returns how many."""
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE outbox SET state = ?, attempts = 0, updated_at = ? WHERE state = ?",
+                (PENDING, time.time(), PARKED)).rowcount
+
+    def compact(self):
+        """Deletes acknowledged rows and checkpoints the WAL. Returns the number of rows removed."""
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM outbox WHERE state = ?", (ACKED,)).rowcount
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return removed
+
+
+def _payload_hash(record):
+    data = record if isinstance(record, (bytes, bytearray, memoryview)) else record.encode('utf-8')
+    return hashlib.sha256(bytes(data)).hexdigest()
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def extract_txn_key(record_text):
+    """
+    Returns the transaction id of a raw punch record (JSON text), or None.
+    The field is configured with PUNCH_ID_FIELD and matched case-insensitively.
+    """
+    field = settings.get_punch_id_field().lower()
+    try:
+        record = json.loads(record_text)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(record, dict):
+        return None
+    for key, value in record.items():
+        if key.lower() == field and value is not None:
+            return str(value)
+    return None
+
+
+def _drain_timeout():
+    # Longest an upload can take with every retry; only a safety net against a batch that
+    # is never uploaded
+    return settings.get_http_max_attempts() * (
+        settings.get_http_connect_timeout() + settings.get_http_read_timeout() + settings.get_http_backoff_max())
+
+
+def iter_sync_batches(outbox, fetch_records, max_records, max_bytes, log=None, fetch_after=None):
+    """
+    Source of upload batches for a sync cycle when the outbox is enabled.
+
+    Records still pending from an earlier cycle are sent first. If the API answers none
+    of them (it is down or the circuit breaker is open), SQL Server is not queried this
+    cycle. Otherwise new punches are read: with `fetch_after(key)` only those beyond the
+    highest key the outbox has stored, else the full `fetch_records()` result minus what
+    the outbox already holds. Each fetched batch is persisted to the outbox before it is
+    handed on for upload.
+    """
+    log = log or logger
+    records = None
+    pending = outbox.count(PENDING)
+    if pending:
+        log.info(f"Outbox has {pending} pending records from an earlier cycle. Draining them before querying the database.")
+        drained = 0
+        for batch in outbox.claim_pending_batches(max_records, max_bytes):
+            drained += 1
+            yield batch
+        if drained and not outbox.wait_for_drain(_drain_timeout()):
+            log.warning("The API did not answer any re-sent batch. Not querying the database for new punches this cycle.")
+            return
+        high_key = outbox.high_key()
+        if fetch_after is not None and high_key is not None:
+            log.info(f"Fetching punches after {high_key}, the highest transaction id in the outbox.")
+            records = fetch_after(high_key)
+
+    if records is None:
+        records = fetch_records()
+    records = ((extract_txn_key(text), text) for text in records)
+    if outbox.depth():
+        records = outbox.skip_stored(records)
+    for batch in iter_batches(records, max_records=max_records, max_bytes=max_bytes, keyed=True):
+        yield outbox.store_batch(batch)
+
+
+def get_outbox():
+    """Returns the process-wide outbox, or None when OUTBOX_ENABLED is off."""
+    global _outbox
+    if not settings.get_outbox_enabled():
+        return None
+    path = settings.get_outbox_path()
+    with _outbox_lock:
+        if _outbox is not None and _outbox.path != path:
+            _outbox.close()
+            _outbox = None
+        if _outbox is None:
+            _outbox = Outbox(path)
+        return _outbox
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect the local outbox (OUTBOX_PATH)")
+    parser.add_argument('command', choices=('stats', 'requeue'),
+                        help="stats: records per state; requeue: send parked records again")
+    parser.add_argument('--path', help="outbox file (default: OUTBOX_PATH)")
+    args = parser.parse_args()
+
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    settings.load(os.path.join(project_root, 'config', '.env'))
+    outbox = Outbox(args.path or settings.get_outbox_path())
+    try:
+        if args.command == 'requeue':
+            print(f"Requeued {outbox.requeue_parked()} parked records.")
+        print(f"{outbox.path}: {outbox.depth() or 'empty'}")
+    finally:
+        outbox.close()
+
+
+if __name__ == '__main__':
+    main()
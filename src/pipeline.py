@@ -0,0 +1,220 @@
+
+import queue
+import logging
+import threading
+
+try:
+    from src.api_client import upload_batches
+    from src.txn_ranges import summarize_ids
+except ImportError:
+    # Fallback for frozen executable where src might be flattened
+    from api_client import upload_batches
+    from txn_ranges import summarize_ids
+
+logger = logging.getLogger("PaythonProgram")
+
+_DONE = object()
+
+
+class SyncPipeline:
+    """
+    Runs the sync cycle as three overlapping stages on worker threads:
+
+        DB reader -> [upload queue] -> API uploader -> [ack queue] -> DB acknowledger
+
+    While batch N is in flight to the API, batch N+1 is being read from the database and
+    batch N-1 is being acknowledged. The queues are bounded, so a slow API applies
+    backpressure to the reader instead of letting fetched batches pile up in memory.
+
+    The uploader keeps up to `upload_workers` requests in flight. With `consolidate_acks`
+    the acknowledger collects every saved id and calls `ack_fn` once at the end instead
+    of once per batch.
+
+    `on_settled(batch, saved_txn_ids)` is called once per batch when its outcome is
+    final: with the acknowledged ids, or None if the upload or acknowledgement failed.
+    """
+
+    def __init__(self, batches, upload_fn, ack_fn, queue_size=2, upload_workers=1,
+                 consolidate_acks=False, on_settled=None, log=None):
+        self.batches = batches
+        self.upload_fn = upload_fn
+        self.ack_fn = ack_fn
+        self.upload_workers = max(1, upload_workers)
+        self.consolidate_acks = consolidate_acks
+        self.on_settled = on_settled
+        self.log = log or logger
+        self._consolidated_ids = []
+        self._consolidated_batches = []
+
+        self._upload_q = queue.Queue(maxsize=max(1, queue_size))
+        self._ack_q = queue.Queue(maxsize=max(1, queue_size))
+        self._abort = threading.Event()
+        self._lock = threading.Lock()
+
+        self.total_batches = 0
+        self.failed_batches = 0
+        self.synced_count = 0
+        self.last_error = None
+        self.reader_error = None
+
+    def run(self):
+        threads = [
+            threading.Thread(target=self._guard, args=(self._read_stage,), name="sync-reader", daemon=True),
+            threading.Thread(target=self._guard, args=(self._upload_stage,), name="sync-uploader", daemon=True),
+            threading.Thread(target=self._guard, args=(self._ack_stage,), name="sync-acker", daemon=True),
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        if self.reader_error is not None and self.total_batches == 0:
+            raise self.reader_error
+
+        return {
+            'total_batches': self.total_batches,
+            'failed_batches': self.failed_batches,
+            'synced_count': self.synced_count,
+            'last_error': self.last_error,
+            'reader_failed': self.reader_error is not None,
+        }
+
+    def stop(self):
+        self._abort.set()
+
+    # --- Stages ---
+
+    def _read_stage(self):
+        try:
+            for batch in self.batches:
+                with self._lock:
+                    self.total_batches += 1
+                if not self._put(self._upload_q, batch):
+                    break
+        except Exception as e:
+            self.log.error(f"Reading punch data failed: {e}")
+            with self._lock:
+                # Not a batch of its own, so it is reported apart from failed_batches
+                self.reader_error = e
+                self.last_error = str(e)
+        finally:
+            self._put(self._upload_q, _DONE, force=True)
+
+    def _upload_stage(self):
+        try:
+            upload_batches(
+                self._queued_batches(),
+                workers=self.upload_workers,
+                on_result=lambda batch, result: self._put(self._ack_q, (batch, result)),
+                upload_fn=self.upload_fn,
+            )
+        finally:
+            self._put(self._ack_q, _DONE, force=True)
+
+    def _queued_batches(self):
+        while True:
+            batch = self._upload_q.get()
+            if batch is _DONE:
+                return
+            if self._abort.is_set():
+                continue  # Drain so the reader is never left blocked
+            yield batch
+
+    def _ack_stage(self):
+        while True:
+            item = self._ack_q.get()
+            if item is _DONE:
+                break
+            batch, api_result = item
+            try:
+                self._acknowledge(batch, api_result)
+            except Exception as e:
+                self.log.exception(f"Acknowledging batch {batch.seq} failed: {e}")
+                self._record_failure(str(e))
+                self._settle(batch, None)
+
+        if self.consolidate_acks and self._consolidated_ids:
+            acked = self._ack_ids("all batches", self._consolidated_ids)
+            for batch, txn_ids in self._consolidated_batches:
+                self._settle(batch, txn_ids if acked else None)
+
+    def _acknowledge(self, batch, api_result):
+        if not (api_result and api_result.get('success')):
+            message = api_result.get('message') if api_result else 'Unknown error'
+            self.log.error(f"API Sync failed for batch {batch.seq}. Message: {message}")
+            self._record_failure(message)
+            self._settle(batch, None)
+            return
+
+        txn_ids = api_result.get('txn_ids')
+        if not txn_ids:
+            self.log.warning(f"API returned success but no transaction IDs for batch {batch.seq}.")
+            self._settle(batch, [])
+            return
+
+        if self.consolidate_acks:
+            self._consolidated_ids.extend(txn_ids)
+            self._consolidated_batches.append((batch, txn_ids))
+            return
+
+        acked = self._ack_ids(f"batch {batch.seq}", txn_ids)
+        self._settle(batch, txn_ids if acked else None)
+
+    def _settle(self, batch, saved_txn_ids):
+        if self.on_settled is None:
+            return
+        try:
+            self.on_settled(batch, saved_txn_ids)
+        except Exception as e:
+            self.log.error(f"Recording the outcome of batch {batch.seq} failed: {e}")
+
+    def _ack_ids(self, label, txn_ids):
+        self.log.info(f"Records of {label} synced. Updating status for {len(txn_ids)} txn ids: {summarize_ids(txn_ids)}")
+        try:
+            update_result = self.ack_fn(txn_ids)
+        except Exception as e:
+            self.log.warning(f"Records of {label} synced but failed to update database status: {e}")
+            self._record_failure(str(e))
+            return False
+
+        if update_result:
+            with self._lock:
+                self.synced_count += len(txn_ids)
+            return True
+
+        self.log.warning(f"Records of {label} synced but failed to update database status.")
+        self._record_failure("Failed to update database status.")
+        return False
+
+    # --- Helpers ---
+
+    def _record_failure(self, message):
+        with self._lock:
+            self.failed_batches += 1
+            self.last_error = message
+
+    def _put(self, q, item, force=False):
+        """
+        Blocking put that gives up when the pipeline is aborted. Forced puts (end markers)
+        always get through: after an abort, queued work is discarded to make room.
+        """
+        while True:
+            if self._abort.is_set() and not force:
+                return False
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                if force and self._abort.is_set():
+                    try:
+                        q.get_nowait()
+                    except queue.Empty:
+                        pass
+
+    def _guard(self, stage):
+        try:
+            stage()
+        except Exception as e:
+            self.log.exception(f"Sync pipeline stage failed: {e}")
+            self._record_failure(str(e))
+            self._abort.set()
@@ -22,8 +22,10 @@ from PyQt6.QtGui import QIcon, QPixmap, QAction
 import winreg
 
 from src.main import run_sync
+from src.api_client import close_session
+from src.logger import add_log_sink
+from src.timings import format_timings
 from config import settings
-from dotenv import load_dotenv
 
 # Ensure env is loaded
 if getattr(sys, 'frozen', False):
@@ -35,7 +37,7 @@ else:
 
 env_path = os.path.join(base_path, 'config', '.env')
 # logging.info(f"Loading environment from: {env_path}") # Moved to __init__
-load_dotenv(env_path, override=True)
+settings.reload(env_path)
 
 def resource_path(relative_path):
     """ Get absolute path to resource, works for dev and for PyInstaller """
@@ -407,10 +409,10 @@ class MainWindow(QMainWindow):
         formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
         handler.setFormatter(formatter)
         
-        # Attach to loggers
+        # Attach to the logging pipeline; records reach the UI from its listener thread
         logger = logging.getLogger("TanhkapayPythonProgram")
-        logger.addHandler(handler)
         logger.setLevel(logging.INFO)
+        add_log_sink(handler)
         
         # Also log to file for debugging
         log_path = settings.get_log_path()
@@ -419,11 +421,7 @@ class MainWindow(QMainWindow):
             
         file_handler = logging.FileHandler(os.path.join(log_path, "debug_gui.log"))
         file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
-        
-        logger2 = logging.getLogger("PaythonProgram")
-        logger2.addHandler(handler)
-        logger2.addHandler(file_handler)
+        add_log_sink(file_handler)
 
         self.log_signal.connect(self.append_log)
 
@@ -525,6 +523,8 @@ class MainWindow(QMainWindow):
         else:
             self.lbl_status.setText(f"Status: Failed - {result['message']}")
             self.lbl_status.setStyleSheet("color: red")
+        # Per-stage durations of the run, on hover
+        self.lbl_status.setToolTip(format_timings(result.get('timings')))
 
     def toggle_scheduler(self, checked):
         if checked:
@@ -762,8 +762,7 @@ class MainWindow(QMainWindow):
                 f.writelines(new_lines)
             
             # Reload
-            from dotenv import load_dotenv
-            load_dotenv(env_path, override=True)
+            settings.reload(env_path)
             QMessageBox.information(self, "Success", "Configuration saved!")
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to save config: {e}")
@@ -838,8 +837,7 @@ class MainWindow(QMainWindow):
             with open(env_path, 'w') as f:
                 f.writelines(new_lines)
                 
-            from dotenv import load_dotenv
-            load_dotenv(env_path, override=True)
+            settings.reload(env_path)
             
         except Exception as e:
             logging.error(f"Failed to update login state: {e}")
@@ -896,6 +894,8 @@ def main():
     logging.info("Application starting...")
     
     app = QApplication(sys.argv)
+    # Release the shared keep-alive HTTP connections on exit (including Quit from the tray)
+    app.aboutToQuit.connect(close_session)
     
     # Check for password protection - REMOVED for persistent login logic
     # logging.info("Verifying password on startup...")
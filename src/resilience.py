@@ -0,0 +1,134 @@
+
+import time
+import random
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+
+logger = logging.getLogger("PaythonProgram")
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter: the n-th retry waits a random time between 0 and
+    min(max_delay, base_delay * 2**(n-1)) seconds. A server supplied Retry-After is honoured
+    (capped at max_delay) instead of the computed delay.
+    """
+
+    def __init__(self, max_attempts=4, base_delay=1.0, max_delay=60.0, retry_statuses=(429, 500, 502, 503, 504)):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses = frozenset(retry_statuses)
+
+    def is_retryable_status(self, status_code):
+        return status_code in self.retry_statuses
+
+    def delay(self, attempt, retry_after=None):
+        """Seconds to wait after failed attempt number `attempt` (1-based)."""
+        if retry_after is not None:
+            return min(self.max_delay, max(0.0, retry_after))
+        cap = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return random.uniform(0, cap)
+
+
+def parse_retry_after(value):
+    """Parses a Retry-After header (delta-seconds or HTTP-date) into seconds, or None."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing API for a while.
+
+    CLOSED: requests flow; `failure_threshold` consecutive failures open the circuit.
+    OPEN: requests are refused until `reset_timeout` seconds have passed.
+    HALF_OPEN: one probe request is let through; success closes the circuit, failure re-opens it.
+               Other callers may wait for the probe's outcome instead of being refused.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=60.0, name="api"):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.name = name
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Condition()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def allow_request(self, probe_wait=0.0):
+        """
+        Returns True if a request may be sent. While a half-open probe is in flight,
+        waits up to `probe_wait` seconds for its outcome before deciding.
+        """
+        deadline = time.monotonic() + probe_wait
+        with self._lock:
+            while True:
+                if self._state == self.CLOSED:
+                    return True
+                if self._state == self.OPEN:
+                    if time.monotonic() - self._opened_at < self.reset_timeout:
+                        return False
+                    self._state = self.HALF_OPEN
+                    self._probe_in_flight = False
+                    logger.info(f"Circuit '{self.name}' half-open. Sending a probe request.")
+                # HALF_OPEN: a single probe at a time
+                if not self._probe_in_flight:
+                    self._probe_in_flight = True
+                    return True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._lock.wait(remaining)
+
+    def retry_in(self):
+        """Seconds until an open circuit will allow a probe."""
+        with self._lock:
+            if self._state != self.OPEN:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info(f"Circuit '{self.name}' closed. API is responding again.")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+            self._lock.notify_all()
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning(f"Circuit '{self.name}' opened after {self._failures} consecutive failures. "
+                                   f"Pausing requests for {self.reset_timeout}s.")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+                self._lock.notify_all()
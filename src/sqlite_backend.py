@@ -0,0 +1,291 @@
+
+import os
+import re
+import random
+import sqlite3
+import argparse
+from datetime import datetime, timedelta
+
+from config import settings
+
+try:
+    from src.txn_ranges import decode_ranges
+except ImportError:
+    # Fallback for frozen executable where src might be flattened
+    from txn_ranges import decode_ranges
+
+# SQL Server splits FOR JSON output into rows of this many characters
+FOR_JSON_CHUNK_CHARS = 2033
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS BioPunches (
+    transactionId INTEGER PRIMARY KEY,
+    empCode TEXT NOT NULL,
+    deviceId TEXT,
+    punchTime TEXT NOT NULL,
+    punchDirection TEXT,
+    isSynced INTEGER NOT NULL DEFAULT 0,
+    syncedAt TEXT
+);
+-- Pending punches in id order: serves getBioPunchesData and the watermark range scan
+CREATE INDEX IF NOT EXISTS IX_BioPunches_Pending ON BioPunches (transactionId) WHERE isSynced = 0;
+CREATE INDEX IF NOT EXISTS IX_BioPunches_EmpTime ON BioPunches (empCode, punchTime);
+"""
+
+_FETCH_SQL = """
+SELECT json_object('transactionId', transactionId, 'empCode', empCode, 'deviceId', deviceId,
+                   'punchTime', punchTime, 'punchDirection', punchDirection)
+FROM BioPunches
+WHERE isSynced = 0{after}
+ORDER BY transactionId
+"""
+
+_MARK_SYNCED_SQL = "UPDATE BioPunches SET isSynced = 1, syncedAt = ? WHERE transactionId = ? AND isSynced = 0"
+
+_CALL_PATTERN = re.compile(r"^\s*\{\s*CALL\s+([\w.\[\]]+)\s*(?:\((.*)\))?\s*\}\s*$", re.IGNORECASE | re.DOTALL)
+_TEMP_TABLE_PATTERN = re.compile(r"#(\w+)")
+
+
+def _iter_for_json(rows, chunk_chars):
+    """Joins one-JSON-object-per-row results into a JSON array split into `chunk_chars` rows, like FOR JSON."""
+    pending = []
+    size = 0
+    started = False
+    for (text,) in rows:
+        piece = (',' if started else '[') + text
+        started = True
+        pending.append(piece)
+        size += len(piece)
+        if size >= chunk_chars:
+            buffer = ''.join(pending)
+            full = len(buffer) - len(buffer) % chunk_chars
+            for pos in range(0, full, chunk_chars):
+                yield (buffer[pos:pos + chunk_chars],)
+            rest = buffer[full:]
+            pending = [rest]
+            size = len(rest)
+    if not started:
+        # No pending punches: FOR JSON returns no rows at all
+        return
+    buffer = ''.join(pending) + ']'
+    for pos in range(0, len(buffer), chunk_chars):
+        yield (buffer[pos:pos + chunk_chars],)
+
+
+def _translate(sql):
+    """Rewrites the T-SQL used around the #BioSyncAck staging table into SQLite."""
+    if 'OBJECT_ID(' in sql and 'CREATE TABLE' in sql:
+        table = _TEMP_TABLE_PATTERN.search(sql.split('CREATE TABLE', 1)[1]).group(1)
+        return f"CREATE TEMP TABLE IF NOT EXISTS {table} (txnId INTEGER NOT NULL PRIMARY KEY)"
+    sql = re.sub(r"^\s*TRUNCATE\s+TABLE\s+", "DELETE FROM ", sql, flags=re.IGNORECASE)
+    return _TEMP_TABLE_PATTERN.sub(r"temp.\1", sql)
+
+
+class SqliteCursor:
+    """
+    pyodbc-style cursor. `{CALL uspManageBioPunchesData (?, ...)}` and the TVP ack
+    procedure are emulated in Python against the BioPunches table; any other statement
+    runs on SQLite directly.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._cursor = connection.raw.cursor()
+        self._rows = iter(())
+        self.arraysize = 1
+        self.fast_executemany = False
+        self.rowcount = -1
+
+    def execute(self, sql, params=()):
+        params = tuple(params or ())
+        match = _CALL_PATTERN.match(sql)
+        if match:
+            self._call(match.group(1).split('.')[-1].strip('[]'), params)
+        else:
+            self._cursor.execute(_translate(sql), params)
+            self._rows = iter(self._cursor)
+            self.rowcount = self._cursor.rowcount
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self._cursor.executemany(_translate(sql), seq_of_params)
+        self.rowcount = self._cursor.rowcount
+
+    def _call(self, procedure, params):
+        cfg = settings.get_settings()
+        self._rows = iter(())
+        if procedure == 'uspManageBioPunchesData':
+            action = params[0] if params else None
+            if action == 'getBioPunchesData':
+                self._fetch()
+            elif action == cfg.incremental_fetch_action:
+                self._fetch(after=params[1])
+            elif action == 'UpdateBioSyncData':
+                self._mark_synced(decode_ranges(params[1] or ''))
+            elif action == cfg.ack_staging_action:
+                self._cursor.execute(
+                    "UPDATE BioPunches SET isSynced = 1, syncedAt = ? "
+                    "WHERE isSynced = 0 AND transactionId IN (SELECT txnId FROM temp.BioSyncAck)",
+                    (_now(),))
+                self.rowcount = self._cursor.rowcount
+            else:
+                raise sqlite3.OperationalError(f"uspManageBioPunchesData: unknown action {action!r}")
+        elif procedure == cfg.ack_tvp_procedure:
+            # Single table-valued parameter of (txnId,) rows
+            self._mark_synced(row[0] for row in params[0])
+        else:
+            raise sqlite3.OperationalError(f"Unknown procedure {procedure}")
+
+    def _fetch(self, after=None):
+        if after is None:
+            self._cursor.execute(_FETCH_SQL.format(after=''))
+        else:
+            self._cursor.execute(_FETCH_SQL.format(after=' AND transactionId > ?'), (int(after),))
+        self._rows = _iter_for_json(self._cursor, self.connection.chunk_chars)
+
+    def _mark_synced(self, txn_ids):
+        synced_at = _now()
+        self._cursor.executemany(_MARK_SYNCED_SQL, ((synced_at, txn_id) for txn_id in txn_ids))
+        self.rowcount = self._cursor.rowcount
+
+    def fetchone(self):
+        return next(self._rows, None)
+
+    def fetchmany(self, size=None):
+        size = size or self.arraysize
+        rows = []
+        for row in self._rows:
+            rows.append(tuple(row))
+            if len(rows) >= size:
+                break
+        return rows
+
+    def fetchall(self):
+        return [tuple(row) for row in self._rows]
+
+    def close(self):
+        self._rows = iter(())
+        self._cursor.close()
+
+
+class SqliteConnection:
+    """pyodbc-style connection over a SQLite database, as used by database.py and the pool."""
+
+    def __init__(self, raw, chunk_chars=FOR_JSON_CHUNK_CHARS):
+        self.raw = raw
+        self.chunk_chars = chunk_chars
+        self.closed = False
+
+    def cursor(self):
+        return SqliteCursor(self)
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def close(self):
+        self.closed = True
+        self.raw.close()
+
+
+def _now():
+    return datetime.now().isoformat(timespec='seconds')
+
+
+def _open(path):
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    # Pooled connections are handed between threads, one at a time
+    raw = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    raw.execute("PRAGMA journal_mode=WAL")
+    raw.execute("PRAGMA synchronous=NORMAL")
+    raw.executescript(SCHEMA)
+    return raw
+
+
+def connect(path=None, chunk_chars=FOR_JSON_CHUNK_CHARS):
+    """Opens the SQLite stand-in database (SQLITE_PATH by default), creating the schema if needed."""
+    return SqliteConnection(_open(path or settings.get_sqlite_path()), chunk_chars)
+
+
+# --- Synthetic data ---
+
+def populate(path, count, synced_ratio=0.0, batch_size=50000, seed=None):
+    """
+    Appends `count` synthetic punches after the highest existing id. A `synced_ratio`
+    share is inserted as already synced, to mimic a table with history.
+    """
+    rng = random.Random(seed)
+    raw = _open(path)
+    try:
+        start = (raw.execute("SELECT MAX(transactionId) FROM BioPunches").fetchone()[0] or 0) + 1
+        base_time = datetime(2024, 1, 1, 8, 0, 0)
+        for batch_start in range(start, start + count, batch_size):
+            batch_end = min(batch_start + batch_size, start + count)
+            rows = []
+            for txn_id in range(batch_start, batch_end):
+                synced = rng.random() < synced_ratio
+                rows.append((
+                    txn_id,
+                    f"EMP{rng.randrange(500):04d}",
+                    f"DEV{rng.randrange(8):02d}",
+                    (base_time + timedelta(seconds=txn_id * 37)).isoformat(),
+                    'IN' if txn_id % 2 else 'OUT',
+                    int(synced),
+                ))
+            raw.executemany(
+                "INSERT INTO BioPunches (transactionId, empCode, deviceId, punchTime, punchDirection, isSynced) "
+                "VALUES (?, ?, ?, ?, ?, ?)", rows)
+            raw.commit()
+        raw.execute("ANALYZE")
+        raw.commit()
+    finally:
+        raw.close()
+
+
+def reset_sync_state(path):
+    """Marks every punch as pending again."""
+    raw = _open(path)
+    try:
+        raw.execute("UPDATE BioPunches SET isSynced = 0, syncedAt = NULL WHERE isSynced = 1")
+        raw.commit()
+    finally:
+        raw.close()
+
+
+def punch_counts(path):
+    """Returns {'pending': n, 'synced': n}."""
+    raw = _open(path)
+    try:
+        rows = raw.execute("SELECT isSynced, COUNT(*) FROM BioPunches GROUP BY isSynced").fetchall()
+    finally:
+        raw.close()
+    counts = dict(rows)
+    return {'pending': counts.get(0, 0), 'synced': counts.get(1, 0)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the SQLite stand-in punch database (DB_BACKEND=sqlite)")
+    parser.add_argument('command', choices=('populate', 'reset', 'stats'))
+    parser.add_argument('--path', help="database file (default: SQLITE_PATH)")
+    parser.add_argument('--count', type=int, default=100000, help="punches to add with populate")
+    parser.add_argument('--synced-ratio', type=float, default=0.0,
+                        help="share of populated punches marked as already synced")
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    settings.load(os.path.join(project_root, 'config', '.env'))
+    path = args.path or settings.get_sqlite_path()
+    if args.command == 'populate':
+        populate(path, args.count, synced_ratio=args.synced_ratio, seed=args.seed)
+    elif args.command == 'reset':
+        reset_sync_state(path)
+    print(f"{path}: {punch_counts(path)}")
+
+
+if __name__ == '__main__':
+    main()
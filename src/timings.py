@@ -0,0 +1,104 @@
+
+import time
+import threading
+from contextlib import contextmanager
+
+# Stages of a sync cycle, in pipeline order
+STAGES = (
+    'config_load',
+    'db_connect',
+    'sp_execute',
+    'result_fetch',
+    'payload_build',
+    'http_send',
+    'response_parse',
+    'ack',
+)
+
+
+class SyncTimings:
+    """
+    Wall-clock time, counts and byte sizes collected during one sync cycle.
+
+    Stages are timed wherever they run, so with concurrent uploads the per-stage
+    totals are summed across threads and can add up to more than the cycle's
+    total duration. Safe to update from several threads.
+    """
+
+    def __init__(self):
+        self._started = time.perf_counter()
+        self._finished = None
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.counts = {}
+        self.bytes = {}
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    def add_bytes(self, name, n):
+        with self._lock:
+            self.bytes[name] = self.bytes.get(name, 0) + n
+
+    def finish(self):
+        if self._finished is None:
+            self._finished = time.perf_counter()
+
+    @property
+    def total(self):
+        end = self._finished if self._finished is not None else time.perf_counter()
+        return end - self._started
+
+    def as_dict(self):
+        with self._lock:
+            ordered = [s for s in STAGES if s in self.stages] + sorted(set(self.stages) - set(STAGES))
+            return {
+                'total_ms': round(self.total * 1000, 1),
+                'stages_ms': {s: round(self.stages[s] * 1000, 1) for s in ordered},
+                'counts': dict(self.counts),
+                'bytes': dict(self.bytes),
+            }
+
+    def log_line(self):
+        """One key=value line with every measurement, for grepping and log shipping."""
+        data = self.as_dict()
+        parts = [f"total_ms={data['total_ms']}"]
+        parts += [f"{stage}_ms={ms}" for stage, ms in data['stages_ms'].items()]
+        parts += [f"{name}={value}" for name, value in sorted(data['counts'].items())]
+        parts += [f"{name}_bytes={value}" for name, value in sorted(data['bytes'].items())]
+        return "Sync timings: " + " ".join(parts)
+
+
+@contextmanager
+def measure(timings, stage):
+    """Times a block into `timings` when one is given; a no-op otherwise."""
+    if timings is None:
+        yield
+        return
+    with timings.stage(stage):
+        yield
+
+
+def format_timings(timings):
+    """Short human readable summary of a result's 'timings' dict, for the UIs."""
+    if not timings:
+        return ""
+    stages = timings.get('stages_ms', {})
+    parts = [f"{stage.replace('_', ' ')} {ms / 1000:.2f}s" for stage, ms in stages.items() if ms >= 1]
+    text = f"Total {timings.get('total_ms', 0) / 1000:.2f}s"
+    if parts:
+        text += " (" + ", ".join(parts) + ")"
+    return text
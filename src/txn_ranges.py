@@ -0,0 +1,67 @@
+
+def _as_int(txn_id):
+    """Returns the id as an int if it is a plain non-negative integer (no sign or leading zeros), else None."""
+    text = str(txn_id).strip()
+    if text.isdigit() and (text == '0' or not text.startswith('0')):
+        return int(text)
+    return None
+
+
+def encode_ranges(txn_ids):
+    """
+    Encodes transaction ids as a compact, sorted range list, e.g.
+    ['1001', '1002', '1003', '1502'] -> '1001-1003,1502'.
+    Duplicates are dropped. Ids that are not plain integers are appended unchanged.
+    """
+    numbers = set()
+    others = []
+    for txn_id in txn_ids:
+        value = _as_int(txn_id)
+        if value is None:
+            text = str(txn_id).strip()
+            if text:
+                others.append(text)
+        else:
+            numbers.add(value)
+
+    parts = []
+    start = prev = None
+    for value in sorted(numbers):
+        if start is None:
+            start = prev = value
+        elif value == prev + 1:
+            prev = value
+        else:
+            parts.append(f"{start}-{prev}" if prev != start else str(start))
+            start = prev = value
+    if start is not None:
+        parts.append(f"{start}-{prev}" if prev != start else str(start))
+
+    return ",".join(parts + others)
+
+
+def decode_ranges(text):
+    """
+    Expands a range list produced by encode_ranges (or a plain comma separated list)
+    back into a list of id strings.
+    """
+    txn_ids = []
+    for token in (text or '').split(','):
+        token = token.strip()
+        if not token:
+            continue
+        low, sep, high = token.partition('-')
+        low_value, high_value = _as_int(low), _as_int(high)
+        if sep and low_value is not None and high_value is not None and low_value <= high_value:
+            txn_ids.extend(str(value) for value in range(low_value, high_value + 1))
+        else:
+            txn_ids.append(token)
+    return txn_ids
+
+
+def summarize_ids(txn_ids, limit=200):
+    """Range encoded ids for log lines, cut to `limit` characters."""
+    encoded = encode_ranges(txn_ids)
+    if len(encoded) > limit:
+        return encoded[:limit] + '...'
+    return encoded
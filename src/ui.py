@@ -16,6 +16,8 @@ sys.path.append(parent_dir)
 
 # Now we can import from src and config
 from src.main import run_sync
+from src.logger import add_log_sink
+from src.timings import format_timings
 from config import settings
 
 # Setup logging capture for UI
@@ -137,14 +139,11 @@ class SyncApp(ctk.CTk):
         self.after(100, self.update_logs)
 
     def setup_logging_redirect(self):
-        logger = logging.getLogger("TanhkapayPythonProgram")
         handler = QueueHandler()
         formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
         handler.setFormatter(formatter)
-        logger.addHandler(handler)
-        # Also catch PaythonProgram logger used in other modules
-        logger2 = logging.getLogger("PaythonProgram")
-        logger2.addHandler(handler)
+        # Receives records from both app loggers via the logging pipeline
+        add_log_sink(handler)
 
     def update_logs(self):
         while not log_queue.empty():
@@ -170,11 +169,9 @@ class SyncApp(ctk.CTk):
             with open(self.env_path, 'w') as f:
                 f.write(content)
             
-            # Reload env
-            from dotenv import load_dotenv
-            load_dotenv(self.env_path, override=True)
+            # Reload env into the settings snapshot
+            settings.reload(self.env_path)
             
-            # Since settings are functions now, they will pull fresh values from os.environ
             self.log_message("Configuration saved and reloaded.", "INFO")
         except Exception as e:
             self.log_message(f"Error saving config: {e}", "ERROR")
@@ -195,6 +192,8 @@ class SyncApp(ctk.CTk):
                  self.log_message(f"Sync Success: {msg}", "INFO")
             else:
                  self.log_message(f"Sync Incomplete: {msg}", "WARNING")
+            if result.get('timings'):
+                 self.log_message(f"Sync Timings: {format_timings(result['timings'])}", "INFO")
         except Exception as e:
             self.log_message(f"Sync Failed: {e}", "ERROR")
         
@@ -0,0 +1,136 @@
+
+import os
+import json
+import time
+import logging
+import threading
+
+from config import settings
+
+logger = logging.getLogger("PaythonProgram")
+
+_watermark = None
+_watermark_lock = threading.Lock()
+
+
+def _as_id(value):
+    """Returns a transaction id as an int, or None if it is not numeric."""
+    try:
+        return int(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+
+
+class Watermark:
+    """
+    Highest transaction id acknowledged so far, persisted in a small JSON file so
+    incremental fetches survive restarts. Also remembers when the last full
+    reconciliation sweep completed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.value = None
+        self.last_full_sweep = 0.0
+        self._lock = threading.Lock()
+
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            self.value = _as_id(state.get('value'))
+            self.last_full_sweep = float(state.get('last_full_sweep') or 0.0)
+        except FileNotFoundError:
+            pass
+        except (ValueError, TypeError, AttributeError) as e:
+            logger.warning(f"Ignoring unreadable watermark file {path}: {e}. Next sync runs a full sweep.")
+
+    def full_sweep_due(self, interval_seconds):
+        with self._lock:
+            if self.value is None:
+                return True
+            return time.time() - self.last_full_sweep >= interval_seconds
+
+    def advance(self, value, full_sweep=False):
+        """Moves the watermark forward to `value` (never backwards) and saves it."""
+        with self._lock:
+            if value is not None and (self.value is None or value > self.value):
+                self.value = value
+            if full_sweep:
+                self.last_full_sweep = time.time()
+            self._save()
+
+    def _save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'value': self.value, 'last_full_sweep': self.last_full_sweep}, f)
+        os.replace(tmp_path, self.path)
+
+
+class WatermarkCycle:
+    """
+    Tracks one sync cycle against the watermark.
+
+    A full sweep runs when none has completed within FULL_SWEEP_INTERVAL_MINUTES (or no
+    watermark exists yet); otherwise only rows beyond the watermark are fetched. The
+    highest acknowledged id is committed at the end of the cycle. If a batch failed and
+    nothing else will retry it (no outbox), the watermark is left where it was.
+    """
+
+    def __init__(self, watermark, fetch_fn, durable_retries=False, log=None):
+        self.watermark = watermark
+        self.fetch_fn = fetch_fn
+        self.durable_retries = durable_retries
+        self.log = log or logger
+        self.full_sweep = watermark.full_sweep_due(settings.get_full_sweep_interval_minutes() * 60)
+        self.queried = False
+        self.failed = False
+        self.highest = None
+        self.non_numeric = 0
+        self._lock = threading.Lock()
+
+    def fetch_records(self):
+        self.queried = True
+        if self.full_sweep:
+            self.log.info("Running a full reconciliation sweep of unsynced punches.")
+            return self.fetch_fn(None)
+        self.log.info(f"Fetching punches after watermark {self.watermark.value}.")
+        return self.fetch_fn(self.watermark.value)
+
+    def observe(self, batch, saved_txn_ids):
+        with self._lock:
+            if saved_txn_ids is None:
+                self.failed = True
+                return
+            for txn_id in saved_txn_ids:
+                value = _as_id(txn_id)
+                if value is None:
+                    self.non_numeric += 1
+                elif self.highest is None or value > self.highest:
+                    self.highest = value
+
+    def commit(self):
+        if self.non_numeric:
+            self.log.warning(f"{self.non_numeric} saved transaction ids are not numeric and cannot advance the watermark.")
+        if self.failed and not self.durable_retries:
+            self.log.warning(f"Some batches failed. Watermark kept at {self.watermark.value} so they are fetched again.")
+            return
+        swept = self.queried and self.full_sweep and not self.failed
+        if self.highest is None and not swept:
+            return
+        self.watermark.advance(self.highest, full_sweep=swept)
+        self.log.info(f"Watermark now {self.watermark.value}" + (" (full sweep completed)." if swept else "."))
+
+
+def get_watermark():
+    """Returns the process-wide watermark, or None when INCREMENTAL_FETCH is off."""
+    global _watermark
+    if not settings.get_incremental_fetch():
+        return None
+    path = settings.get_watermark_path()
+    with _watermark_lock:
+        if _watermark is None or _watermark.path != path:
+            _watermark = Watermark(path)
+        return _watermark
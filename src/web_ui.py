@@ -6,9 +6,9 @@ import schedule
 import time
 from datetime import datetime
 import logging
-import queue
 import webbrowser
-from flask import Flask, render_template_string, render_template, request, jsonify, redirect, url_for
+from collections import deque
+from flask import Flask, Response, render_template_string, render_template, request, jsonify, redirect, url_for
 
 # Adjust path to find src/config modules
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -16,6 +16,9 @@ parent_dir = os.path.dirname(current_dir)
 sys.path.append(parent_dir)
 
 from src.main import run_sync
+from src.jobs import JobManager
+from src.logger import add_log_sink
+from src import metrics
 from config import settings
 
 app = Flask(__name__)
@@ -26,15 +29,50 @@ scheduler_running = False
 stop_event = threading.Event()
 scheduler_thread = None
 
-# Log Queue
-log_queue = queue.Queue()
-log_history = []
+# Sync jobs: manual and scheduled runs share one in-flight job
+JOB_WORKERS = 2
+jobs = JobManager(lambda progress: run_sync(progress=progress), workers=JOB_WORKERS)
+
+# Log history for the Logs page
+LOG_HISTORY_SIZE = 500
+# Idle SSE connections get a comment this often so proxies and browsers keep them open
+SSE_KEEPALIVE_SECONDS = 15
+
+class LogBuffer:
+    """
+    The last LOG_HISTORY_SIZE formatted log lines, each with an increasing sequence id.
+    Readers wait for lines newer than the last id they saw instead of re-reading everything.
+    """
+
+    def __init__(self, maxlen=LOG_HISTORY_SIZE):
+        self._lines = deque(maxlen=maxlen)
+        self._last_id = 0
+        self._cond = threading.Condition()
+
+    def append(self, line):
+        with self._cond:
+            self._last_id += 1
+            self._lines.append((self._last_id, line))
+            self._cond.notify_all()
+
+    def since(self, last_id, timeout=None):
+        """
+        Returns [(id, line)] newer than `last_id`, waiting up to `timeout` seconds for one.
+        An id from before a restart (greater than any issued) returns the whole history.
+        """
+        with self._cond:
+            if last_id > self._last_id:
+                last_id = 0
+            if timeout and last_id == self._last_id:
+                self._cond.wait(timeout)
+            return [(seq, line) for seq, line in self._lines if seq > last_id]
+
+log_buffer = LogBuffer()
 
 class QueueHandler(logging.Handler):
     def emit(self, record):
         try:
-            log_entry = self.format(record)
-            log_queue.put(log_entry)
+            log_buffer.append(self.format(record))
         except Exception:
             pass
 
@@ -44,9 +82,8 @@ def setup_logging_redirect():
     formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
     handler.setFormatter(formatter)
     
-    # Attach to key loggers
-    logging.getLogger("TanhkapayPythonProgram").addHandler(handler)
-    logging.getLogger("PaythonProgram").addHandler(handler)
+    # Receives records from both app loggers via the logging pipeline
+    add_log_sink(handler)
     logging.getLogger("werkzeug").setLevel(logging.ERROR) # Quiet flask logs
 
 setup_logging_redirect()
@@ -66,7 +103,7 @@ BASE_TEMPLATE = """
         .container { max-width: 900px; background: white; padding: 30px; border-radius: 10px; box-shadow: 0 4px 6px rgba(0,0,0,0.1); }
         .nav-link.active { font-weight: bold; border-bottom: 2px solid #0d6efd; }
         #logs-container { height: 400px; overflow-y: scroll; background: #212529; color: #0f0; padding: 15px; font-family: monospace; border-radius: 5px; }
-        .log-entry { margin-bottom: 2px; }
+        .log-entry { margin-bottom: 2px; white-space: pre-wrap; }
     </style>
 </head>
 <body>
@@ -192,26 +229,69 @@ DASHBOARD_TEMPLATE = """
         });
     }
 
+    const SPINNER = '<div class="spinner-border spinner-border-sm text-primary" role="status"><span class="visually-hidden">Loading...</span></div>';
+
     function runSync() {
         const btn = document.getElementById('btn-run-now');
         const status = document.getElementById('sync-status');
         btn.disabled = true;
-        status.innerHTML = '<div class="spinner-border text-primary" role="status"><span class="visually-hidden">Loading...</span></div> Syncing...';
-        
+        status.innerHTML = `${SPINNER} Starting sync...`;
+
         fetch('/api/run', { method: 'POST' })
             .then(res => res.json())
-            .then(data => {
-                const color = data.success ? 'text-success' : 'text-danger';
-                status.innerHTML = `<div class="${color} fw-bold">${data.message}</div>`;
-            })
+            .then(data => showJob(data.job))
             .catch(err => {
                 status.innerHTML = `<div class="text-danger fw-bold">Error: ${err}</div>`;
-            })
-            .finally(() => {
                 btn.disabled = false;
             });
     }
 
+    // Shows a job's progress and keeps polling until it has finished
+    function showJob(job) {
+        const btn = document.getElementById('btn-run-now');
+        const status = document.getElementById('sync-status');
+
+        if (job.status === 'queued' || job.status === 'running') {
+            btn.disabled = true;
+            const stage = job.status === 'queued' ? 'Queued' : `Syncing (${job.stage || 'starting'})`;
+            status.innerHTML = `${SPINNER} ${stage}: ${job.records_synced} records synced, ` +
+                `${job.batches} batches, ${job.elapsed_seconds.toFixed(0)}s elapsed`;
+            setTimeout(() => {
+                fetch(`/api/jobs/${job.id}`)
+                    .then(res => res.json())
+                    .then(showJob)
+                    .catch(err => {
+                        status.innerHTML = `<div class="text-danger fw-bold">Error: ${err}</div>`;
+                        btn.disabled = false;
+                    });
+            }, 1000);
+            return;
+        }
+
+        const result = job.result || {};
+        const color = result.success ? 'text-success' : 'text-danger';
+        status.innerHTML = `<div class="${color} fw-bold">${result.message}</div>` + formatTimings(result.timings);
+        btn.disabled = false;
+    }
+
+    function formatTimings(timings) {
+        if (!timings) return '';
+        const stages = Object.entries(timings.stages_ms || {})
+            .filter(([, ms]) => ms >= 1)
+            .map(([stage, ms]) => `${stage.replace(/_/g, ' ')} ${(ms / 1000).toFixed(2)}s`);
+        let text = `Total ${(timings.total_ms / 1000).toFixed(2)}s`;
+        if (stages.length) text += ` (${stages.join(', ')})`;
+        return `<div class="text-muted small">${text}</div>`;
+    }
+
+    // Pick up a sync that is already running (e.g. after a page reload)
+    fetch('/api/jobs')
+        .then(res => res.json())
+        .then(data => {
+            const job = data.jobs[0];
+            if (job && (job.status === 'queued' || job.status === 'running')) showJob(job);
+        });
+
     // Check status on load
     fetch('/api/schedule/status')
         .then(res => res.json())
@@ -252,24 +332,41 @@ LOGS_TEMPLATE = """
 {% block content %}
 <div class="d-flex justify-content-between align-items-center mb-3">
     <h3>Application Logs</h3>
-    <button class="btn btn-outline-secondary btn-sm" onclick="fetchLogs()">Refresh Logs</button>
+    <span id="logs-status" class="badge bg-secondary">Connecting...</span>
 </div>
-<div id="logs-container">Loading logs...</div>
+<div id="logs-container"></div>
 {% endblock %}
 
 {% block scripts %}
 <script>
-    function fetchLogs() {
-        fetch('/api/logs')
-            .then(response => response.json())
-            .then(data => {
-                const container = document.getElementById('logs-container');
-                container.innerText = data.logs;
-                container.scrollTop = container.scrollHeight;
-            });
-    }
-    fetchLogs();
-    setInterval(fetchLogs, 5000); // Auto refresh every 5s
+    const MAX_LOG_LINES = {{ max_lines }};
+    const container = document.getElementById('logs-container');
+    const statusBadge = document.getElementById('logs-status');
+
+    // The browser reconnects by itself and sends Last-Event-ID, so only missed lines arrive
+    const source = new EventSource('/api/logs/stream');
+
+    source.onopen = () => {
+        statusBadge.className = 'badge bg-success';
+        statusBadge.innerText = 'Live';
+    };
+
+    source.onmessage = (event) => {
+        const atBottom = container.scrollTop + container.clientHeight >= container.scrollHeight - 5;
+        const entry = document.createElement('div');
+        entry.className = 'log-entry';
+        entry.textContent = event.data;
+        container.appendChild(entry);
+        while (container.childElementCount > MAX_LOG_LINES) {
+            container.removeChild(container.firstElementChild);
+        }
+        if (atBottom) container.scrollTop = container.scrollHeight;
+    };
+
+    source.onerror = () => {
+        statusBadge.className = 'badge bg-warning text-dark';
+        statusBadge.innerText = 'Reconnecting...';
+    };
 </script>
 {% endblock %}
 """
@@ -304,8 +401,7 @@ def config_page():
             with open(env_path, 'w') as f:
                 f.write(content)
             
-            from dotenv import load_dotenv
-            load_dotenv(env_path, override=True)
+            settings.reload(env_path)
             return render_template('config', active_tab='config', configs=request.form, message="Saved!", category="success")
         
         except Exception as e:
@@ -323,26 +419,67 @@ def config_page():
 
 @app.route('/logs')
 def logs_page():
-    return render_template('logs', active_tab='logs')
+    return render_template('logs', active_tab='logs', max_lines=LOG_HISTORY_SIZE)
 
 @app.route('/api/run', methods=['POST'])
 def api_run():
-    logging.getLogger("TanhkapayPythonProgram").info("Manual sync initiated from Web UI.")
-    try:
-        result = run_sync()
-        return jsonify(result)
-    except Exception as e:
-        return jsonify({'success': False, 'message': str(e)})
+    job, created = jobs.submit(trigger='manual')
+    if created:
+        logging.getLogger("TanhkapayPythonProgram").info(f"Manual sync initiated from Web UI (job {job.id}).")
+    else:
+        logging.getLogger("TanhkapayPythonProgram").info(f"Sync already in progress; manual trigger joined job {job.id}.")
+    return jsonify({'success': True, 'job_id': job.id, 'deduplicated': not created, 'job': job.as_dict()}), 202
+
+@app.route('/api/jobs')
+def api_jobs():
+    return jsonify({'jobs': [job.as_dict() for job in jobs.recent()]})
+
+@app.route('/api/jobs/<job_id>')
+def api_job(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Unknown job'}), 404
+    return jsonify(job.as_dict())
+
+@app.route('/metrics')
+def metrics_endpoint():
+    # Prometheus text exposition format, for scraping
+    return Response(metrics.render_metrics(), mimetype=None, content_type=metrics.CONTENT_TYPE)
 
 @app.route('/api/logs')
 def api_logs():
-    # Drain queue to history list
-    while not log_queue.empty():
-        log_history.append(log_queue.get())
-        if len(log_history) > 500:
-            log_history.pop(0)
-            
-    return jsonify({'logs': "".join(log_history)})
+    return jsonify({'logs': "\n".join(line for _, line in log_buffer.since(0))})
+
+def format_sse_event(event_id, text):
+    # Every line of a multi-line record (e.g. a traceback) needs its own data: field.
+    # splitlines() also breaks on \r, which a client would otherwise treat as a line end.
+    data = "".join(f"data: {line}\n" for line in text.splitlines() or [""])
+    return f"id: {event_id}\n{data}\n"
+
+@app.route('/api/logs/stream')
+def api_logs_stream():
+    """
+    Server-Sent Events stream of log lines. New clients get the retained history first;
+    reconnecting clients send Last-Event-ID and only receive what they missed.
+    """
+    try:
+        last_id = int(request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or 0)
+    except ValueError:
+        last_id = 0
+
+    def generate(last_id):
+        yield "retry: 3000\n\n"
+        while True:
+            entries = log_buffer.since(last_id, timeout=SSE_KEEPALIVE_SECONDS)
+            if not entries:
+                yield ": keep-alive\n\n"
+                continue
+            for event_id, line in entries:
+                yield format_sse_event(event_id, line)
+            last_id = entries[-1][0]
+
+    return Response(generate(last_id), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 # Scheduler
 current_interval = 60
@@ -387,14 +524,18 @@ def api_sched_status():
     return jsonify({'running': scheduler_running, 'interval': current_interval})
 
 def run_sync_safe():
-    logging.getLogger("TanhkapayPythonProgram").info("Scheduled sync starting...")
-    try:
-        run_sync()
-    except Exception as e:
-        logging.getLogger("TanhkapayPythonProgram").error(f"Scheduled sync failed: {e}")
+    job, created = jobs.submit(trigger='schedule')
+    if created:
+        logging.getLogger("TanhkapayPythonProgram").info(f"Scheduled sync starting (job {job.id})...")
+    else:
+        logging.getLogger("TanhkapayPythonProgram").warning(f"Previous sync (job {job.id}) still running. Skipping scheduled run.")
 
 def run_scheduler_loop():
     while scheduler_running and not stop_event.is_set():
+        now = datetime.now()
+        for job in schedule.get_jobs():
+            if job.should_run:
+                metrics.SCHEDULER_LAG.observe(max(0.0, (now - job.next_run).total_seconds()))
         schedule.run_pending()
         time.sleep(1)
 
@@ -0,0 +1,135 @@
+import sys
+import os
+import json
+import shutil
+import logging
+import tempfile
+import unittest
+from unittest import mock
+
+# Adjust path to find src/config modules
+current_dir = os.path.dirname(os.path.abspath(__file__))
+# Assuming this script runs from project root
+sys.path.append(current_dir)
+
+from config import settings
+from src import main, outbox, sqlite_backend
+from src.database import close_pool
+
+class UnsavedRecordApi:
+    """Stands in for send_punch_data: saves every record except the given transaction ids."""
+
+    def __init__(self, never_saved=()):
+        self.never_saved = {str(t) for t in never_saved}
+        self.uploaded = []
+
+    def __call__(self, batch, timings=None):
+        ids = [str(record['transactionId']) for record in json.loads(batch.payload())]
+        self.uploaded.extend(ids)
+        saved = [t for t in ids if t not in self.never_saved]
+        return {'success': True, 'txn_ids': saved, 'message': 'Data Saved Successfully.', 'answered': True}
+
+def api_down(batch, timings=None):
+    return {'success': False, 'message': 'Http Error: 503'}
+
+class TestOutboxStarvation(unittest.TestCase):
+    def setUp(self):
+        self.state_dir = tempfile.mkdtemp(prefix='paython-outbox-')
+        self.db_path = os.path.join(self.state_dir, 'punches.db')
+        self.env = mock.patch.dict(os.environ, {
+            'DB_BACKEND': 'sqlite',
+            'SQLITE_PATH': self.db_path,
+            'OUTBOX_ENABLED': 'True',
+            'OUTBOX_PATH': os.path.join(self.state_dir, 'outbox.db'),
+            'OUTBOX_MAX_ATTEMPTS': '3',
+            'INCREMENTAL_FETCH': 'False',
+            'UPLOAD_BATCH_MAX_RECORDS': '4',
+            'LOG_TO_FILE': 'False',
+        })
+        self.env.start()
+        # Snapshot from the variables above; no .env file is tracked
+        settings.reload()
+        self.logger = logging.getLogger("PaythonProgram")
+        sqlite_backend.populate(self.db_path, 10, seed=1)
+
+    def tearDown(self):
+        close_pool()
+        with outbox._outbox_lock:
+            if outbox._outbox is not None:
+                outbox._outbox.close()
+                outbox._outbox = None
+        self.env.stop()
+        settings.reload()
+        shutil.rmtree(self.state_dir, ignore_errors=True)
+
+    def run_cycle(self, api):
+        with mock.patch.object(main, 'send_punch_data', api):
+            return main.run_sync(self.logger)
+
+    def count_fetches(self):
+        return mock.patch.object(main, 'iter_bio_punches_records', wraps=main.iter_bio_punches_records)
+
+    def test_new_punches_sync_while_a_record_stays_pending(self):
+        api = UnsavedRecordApi(never_saved=[3])
+        self.run_cycle(api)
+        self.assertEqual(sqlite_backend.punch_counts(self.db_path), {'pending': 1, 'synced': 9})
+
+        # New punches arrive while txn 3 is still pending in the outbox
+        sqlite_backend.populate(self.db_path, 10, seed=2)
+        api.uploaded.clear()
+        result = self.run_cycle(api)
+
+        self.assertEqual(sqlite_backend.punch_counts(self.db_path), {'pending': 1, 'synced': 19})
+        self.assertIn('synced 10 records', result['message'])
+        # Txn 3 is retried once, and the new punches are not stored a second time
+        self.assertEqual(sorted(api.uploaded, key=int), [str(t) for t in [3] + list(range(11, 21))])
+
+    def test_record_is_parked_after_max_attempts(self):
+        api = UnsavedRecordApi(never_saved=[3])
+        for _ in range(3):
+            self.run_cycle(api)
+        self.assertEqual(outbox.get_outbox().depth(), {outbox.PARKED: 1})
+
+        api.uploaded.clear()
+        self.run_cycle(api)
+        self.assertNotIn('3', api.uploaded)
+
+        self.assertEqual(outbox.get_outbox().requeue_parked(), 1)
+        self.assertEqual(outbox.get_outbox().depth(), {outbox.PENDING: 1})
+
+    def test_failed_uploads_do_not_count_as_attempts(self):
+        for _ in range(4):
+            self.run_cycle(api_down)
+        self.assertEqual(outbox.get_outbox().depth(), {outbox.PENDING: 10})
+
+        self.run_cycle(UnsavedRecordApi())
+        self.assertEqual(sqlite_backend.punch_counts(self.db_path), {'pending': 0, 'synced': 10})
+
+    def test_database_is_not_queried_while_the_api_is_down(self):
+        self.run_cycle(api_down)
+        self.assertEqual(outbox.get_outbox().depth(), {outbox.PENDING: 10})
+
+        sqlite_backend.populate(self.db_path, 10, seed=2)
+        with self.count_fetches() as fetch:
+            self.run_cycle(api_down)
+            self.run_cycle(api_down)
+        fetch.assert_not_called()
+        self.assertEqual(outbox.get_outbox().depth(), {outbox.PENDING: 10})
+
+        # Once the API answers again, only punches beyond the outbox's highest id are read
+        with self.count_fetches() as fetch:
+            self.run_cycle(UnsavedRecordApi())
+        self.assertEqual([c.kwargs.get('after') for c in fetch.call_args_list], [10])
+        self.assertEqual(sqlite_backend.punch_counts(self.db_path), {'pending': 0, 'synced': 20})
+
+    def test_records_without_transaction_id_are_stored_once(self):
+        os.environ['PUNCH_ID_FIELD'] = 'noSuchField'
+        settings.reload()
+        no_ids = lambda batch, timings=None: {'success': True, 'txn_ids': [], 'message': 'Data Saved Successfully.',
+                                              'answered': True}
+        for _ in range(2):
+            self.run_cycle(no_ids)
+        self.assertEqual(outbox.get_outbox().depth(), {outbox.PENDING: 10})
+
+if __name__ == '__main__':
+    unittest.main()